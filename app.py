@@ -1,19 +1,35 @@
+import cProfile
 import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import pstats
+import threading
+import time
 
 import pytz as pytz
-from flask import Flask, render_template, session, request, redirect, url_for, send_file
+from flask import Flask, render_template, session, request, redirect, url_for, send_file, g, Response, jsonify
 
-from server.lp import Data, LpSolve
-from server.meta_data import MenuTypes
+from server import metrics
+from server.meta_data import MenuTypes, MetaData
 from server.session import Session
-from server.document import render_table
-from server.config import SECRET_FLASK, SPACE
+from server.solver import SolverBusy, SolveFailed, SolveLimitExceeded, submit, submit_all, submit_quantiles, warm_up
+from server.config import SECRET_FLASK, SPACE, PROFILING, PROFILE_DIR, SOLVE_RETRY_AFTER, \
+    SERVE_THREADS, SERVE_CONNECTION_LIMIT, SERVE_BACKLOG, PREWARM, COMPRESS_MIN_SIZE, PAGE_SIZE, \
+    UPLOAD_MAX_BYTES, QUANTILES_DEFAULT
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 app = Flask(__name__)
 app.secret_key = SECRET_FLASK
-ALLOWED_EXTENSIONS = set(['txt'])
-app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024
+ALLOWED_EXTENSIONS = set(['txt', 'csv', 'npy', 'parquet', 'feather', 'arrow'])
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES
 app.permanent_session_lifetime = datetime.timedelta(days=1)
 
 
@@ -60,7 +76,166 @@ def allowed_file(filename):
     """
 
     return '.' in filename and \
-           filename.rsplit('.', 1)[1] in ALLOWED_EXTENSIONS
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def render(template_name, **context):
+    """
+    Рендерит шаблон с замером времени работы Jinja.
+    """
+
+    with metrics.timer('render'):
+        return render_template(template_name, **context)
+
+
+@app.before_request
+def before_request():
+    metrics.request_started()
+    g.start_time = time.perf_counter()
+
+    if PROFILING and request.headers.get('X-Profile'):
+        g.profile = cProfile.Profile()
+        g.profile.enable()
+
+
+@app.after_request
+def after_request(response):
+    if 'profile' in g:
+        g.profile.disable()
+        _dump_profile(g.profile)
+
+    response = _compress(response)
+
+    metrics.request_finished(request.endpoint or 'unknown', time.perf_counter() - g.start_time)
+    return response
+
+
+COMPRESS_MIMETYPES = {'text/html', 'text/plain', 'application/json'}
+
+
+def _compress(response):
+    """
+    Сжимает крупные текстовые ответы в br (если установлен brotli) или gzip.
+    """
+
+    if response.direct_passthrough or response.status_code != 200 or 'Content-Encoding' in response.headers \
+            or response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    encodings = request.accept_encodings
+    if brotli is not None and encodings['br']:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif encodings['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def get_page() -> int:
+    """
+    Получает номер страницы просмотра матрицы из параметра page.
+    """
+
+    return max(request.args.get('page', 1, type=int), 1)
+
+
+def make_etag(_session: Session, *parts) -> str:
+    """
+    Формирует ETag страницы из токена сессии и версий данных, от которых она зависит.
+    """
+
+    token = hashlib.sha1(_session.token.body.encode()).hexdigest()[:16]
+    return '-'.join([token] + [str(part) for part in parts])
+
+
+def not_modified(etag: str):
+    """
+    Возвращает ответ 304, если у клиента актуальная версия страницы, иначе None.
+    """
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        return with_etag(response, etag)
+    return None
+
+
+def with_etag(response, etag: str):
+    """
+    Добавляет к ответу ETag. Кэш браузера обязан перепроверять страницу при каждом обращении.
+    """
+
+    response = app.make_response(response)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@app.errorhandler(SolverBusy)
+def solver_busy(error):
+    """
+    Очередь решений заполнена: клиенту предлагается повторить запрос позже,
+    вместо неограниченного роста задержки у всех пользователей.
+    """
+
+    return Response('Сервер перегружен, повторите запрос позже.', status=503,
+                    headers={'Retry-After': str(SOLVE_RETRY_AFTER)}, mimetype='text/plain')
+
+
+@app.errorhandler(SolveFailed)
+def solve_failed(error):
+    """
+    Воркеры очереди не смогли решить задачу за все попытки.
+    """
+
+    app.logger.error('Solve failed: %s', error)
+    return Response('Не удалось решить задачу, повторите запрос позже.', status=500, mimetype='text/plain')
+
+
+@app.errorhandler(SolveLimitExceeded)
+def solve_limit_exceeded(error):
+    """
+    Задача не помещается в ограничения памяти или времени решателя:
+    отклонена по прогнозу размера модели или прервана во время решения.
+    """
+
+    metrics.SOLVE_LIMIT_EXCEEDED.inc()
+    return Response(f'Задача слишком велика: {error}', status=413, mimetype='text/plain')
+
+
+def check_upload_size(rows: int, cols: int, restrictions: int = 0):
+    """
+    Отклоняет загрузку, для которой модель не поместится в память даже у быстрого решателя.
+    Прогноз берётся по наибольшему числу коэффициентов: все столбцы, кроме отклика, и свободный член.
+    :raises ValueError: прогноз превышает SOLVE_MEMORY_LIMIT.
+    """
+
+    from server.limits import check_model_size
+
+    try:
+        check_model_size(rows, cols, restrictions, fast=True)
+    except SolveLimitExceeded as e:
+        raise ValueError(str(e))
+
+
+def _dump_profile(profile: cProfile.Profile):
+    """
+    Выводит в лог разбивку времени запроса по функциям и, если задан
+    PROFILE_DIR, сохраняет профиль в файл для анализа в pstats/snakeviz.
+    """
+
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(40)
+    app.logger.info('Profile %s %s\n%s', request.method, request.path, stream.getvalue())
+
+    if PROFILE_DIR:
+        name = f'{request.endpoint or "unknown"}_{int(time.time() * 1000)}.prof'
+        profile.dump_stats(os.path.join(PROFILE_DIR, name))
 
 
 def get_session():
@@ -92,8 +267,7 @@ def main():
     meta_data = _session.meta_data
     meta_data.set_active_menu(MenuTypes.MAIN)
 
-    _session.meta_data = meta_data
-    return render_template('main.html', meta_data=meta_data)
+    return render('main.html', meta_data=meta_data)
 
 
 @app.route('/load', methods=['GET'])
@@ -108,8 +282,112 @@ def load_get():
     meta_data = _session.meta_data
     meta_data.set_active_menu(MenuTypes.LOAD)
 
+    return render('load.html', meta_data=meta_data, page=get_page(), page_size=PAGE_SIZE)
+
+
+def load_dataset(_session: Session, content: bytes):
+    """
+    Разбирает загруженный файл, сохраняет матрицу в хранилище наборов данных
+    и привязывает её к сессии. Ограничения и результат сбрасываются.
+    :param _session: сессия пользователя.
+    :param content: содержимое файла.
+    :return: метаданные сессии с новым набором данных.
+    :raises ValueError: файл не удалось разобрать.
+    """
+
+    from server.dataset import get_store
+    from server.loader import load_matrix
+
+    with metrics.timer('parse'):
+        matrix = load_matrix(content)
+    check_upload_size(*matrix.shape)
+
+    meta_data = _session.meta_data
+    store = get_store()
+    dataset_id = store.put(matrix, _session.token.body)
+    if meta_data.dataset_id and meta_data.dataset_id != dataset_id:
+        store.unref(meta_data.dataset_id, _session.token.body)
+    meta_data.set_load_data(matrix, dataset_id)
+    meta_data.update_column_stats(matrix)
+
     _session.meta_data = meta_data
-    return render_template('load.html', meta_data=meta_data)
+    _session.result = None
+    _session.restriction = None
+    return meta_data
+
+
+def append_dataset(_session: Session, content: bytes):
+    """
+    Дописывает строки из загруженного файла к матрице сессии. Ограничения и
+    результат сохраняются, статистика столбцов обновляется только по новым строкам,
+    а решатель дополняет ранее решённую задачу вместо построения заново.
+    Хранимая матрица целиком не читается: строки дописываются в хранилище.
+    :param _session: сессия пользователя.
+    :param content: содержимое файла с новыми строками.
+    :return: метаданные сессии с дополненным набором данных.
+    :raises ValueError: файл не удалось разобрать или данные ещё не загружены.
+    """
+
+    from server.dataset import get_store
+    from server.loader import load_matrix
+
+    meta_data = _session.meta_data
+    store = get_store()
+    dtype = store.dtype(meta_data.dataset_id) if meta_data.has_load_data() else None
+    if dtype is None:
+        raise ValueError('Сначала загрузите исходные данные.')
+
+    # Строки приводятся к типу набора: дописывание не меняет точность хранения.
+    with metrics.timer('parse'):
+        rows = load_matrix(content, dtype)
+    if rows.shape[1] != meta_data.cols:
+        raise ValueError(f'Добавляемые строки должны содержать {meta_data.cols} столбцов.')
+    check_upload_size(meta_data.rows + len(rows), meta_data.cols, len(_session.restriction.entries))
+
+    dataset_id = store.append(meta_data.dataset_id, rows, _session.token.body)
+    if dataset_id is None:
+        raise ValueError('Сначала загрузите исходные данные.')
+    meta_data.append_load_data(rows, dataset_id)
+
+    _session.meta_data = meta_data
+    return meta_data
+
+
+def append_weights(_session: Session, weights: list):
+    """
+    Дописывает веса наблюдений к матрице сессии последним столбцом и выбирает его столбцом весов.
+    :raises ValueError: данные не загружены или веса не подходят.
+    """
+
+    import numpy as np
+    from server.dataset import get_store
+
+    meta_data = _session.meta_data
+    load_data = meta_data.load_data if meta_data.has_load_data() else None
+    if load_data is None:
+        raise ValueError('Сначала загрузите исходные данные.')
+
+    try:
+        weights = np.asarray(weights, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError('Веса наблюдений должны быть числами.')
+    if weights.shape != (meta_data.rows,):
+        raise ValueError(f'Нужно {meta_data.rows} весов - по одному на наблюдение.')
+    if (weights < 0).any():
+        raise ValueError('Веса наблюдений должны быть неотрицательными.')
+
+    matrix = np.column_stack([load_data, weights.astype(load_data.dtype)])
+    store = get_store()
+    dataset_id = store.put(matrix, _session.token.body)
+    if meta_data.dataset_id != dataset_id:
+        store.unref(meta_data.dataset_id, _session.token.body)
+    meta_data.set_load_data(matrix, dataset_id)
+    meta_data.update_column_stats(matrix)
+    meta_data.weights_col = meta_data.cols
+
+    _session.meta_data = meta_data
+    _session.result = None
+    return meta_data
 
 
 @app.route('/load', methods=['POST'])
@@ -121,22 +399,88 @@ def load_post():
     _session = get_session()
     save_session(_session)
 
+    error = None
+    file = request.files.get('file')
+    if file and allowed_file(file.filename):
+        content = file.stream.read()
+        file.close()
+        try:
+            load_dataset(_session, content)
+        except ValueError as e:
+            error = str(e)
+    else:
+        error = f'Поддерживаются файлы: {", ".join(sorted(ALLOWED_EXTENSIONS))}.'
+
     meta_data = _session.meta_data
     meta_data.set_active_menu(MenuTypes.LOAD)
+    return render('load.html', meta_data=meta_data, page=get_page(), page_size=PAGE_SIZE, error=error)
+
+
+@app.route('/api/load', methods=['POST'])
+def api_load():
+    """
+    Загружает исходные данные без HTML: файл передаётся в поле file
+    формы multipart или телом запроса. Формат определяется по содержимому.
+    """
+
+    _session = get_session()
+    save_session(_session)
 
-    file = request.files['file']
+    file = request.files.get('file')
+    content = file.stream.read() if file else request.get_data()
+    try:
+        meta_data = load_dataset(_session, content)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'dataset_id': meta_data.dataset_id, 'rows': meta_data.rows, 'cols': meta_data.cols})
+
+
+@app.route('/load/append', methods=['POST'])
+def load_append():
+    """
+    Обрабатывает загрузку файла с новыми строками исходных данных.
+    """
+
+    _session = get_session()
+    save_session(_session)
+
+    error = None
+    file = request.files.get('file')
     if file and allowed_file(file.filename):
-        _list = []
-        for line in file.stream.readlines():
-            _list.append(list(map(float, line.decode('utf-8').split())))
+        content = file.stream.read()
         file.close()
-        meta_data.load_data = _list
-        del _list
+        try:
+            append_dataset(_session, content)
+        except ValueError as e:
+            error = str(e)
+    else:
+        error = f'Поддерживаются файлы: {", ".join(sorted(ALLOWED_EXTENSIONS))}.'
 
-    _session.meta_data = meta_data
-    _session.result = None
-    _session.restriction = None
-    return render_template('load.html', meta_data=meta_data)
+    meta_data = _session.meta_data
+    meta_data.set_active_menu(MenuTypes.LOAD)
+    return render('load.html', meta_data=meta_data, page=get_page(), page_size=PAGE_SIZE, error=error)
+
+
+@app.route('/api/append', methods=['POST'])
+def api_append():
+    """
+    Дописывает строки к исходным данным без HTML: файл передаётся в поле file
+    формы multipart или телом запроса.
+    """
+
+    _session = get_session()
+    save_session(_session)
+
+    file = request.files.get('file')
+    content = file.stream.read() if file else request.get_data()
+    try:
+        meta_data = append_dataset(_session, content)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'dataset_id': meta_data.dataset_id, 'rows': meta_data.rows, 'cols': meta_data.cols,
+                    'appended_rows': meta_data.appended_rows})
 
 
 @app.route('/data', methods=["GET"])
@@ -148,11 +492,16 @@ def data_get():
     _session = get_session()
     save_session(_session)
 
+    page = get_page()
+    etag = make_etag(_session, 'data', _session.versions['meta_data'], page)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
     meta_data = _session.meta_data
     meta_data.set_active_menu(MenuTypes.DATA)
 
-    _session.meta_data = meta_data
-    return render_template('data.html', meta_data=meta_data)
+    return with_etag(render('data.html', meta_data=meta_data, page=page, page_size=PAGE_SIZE), etag)
 
 
 @app.route('/answer')
@@ -164,15 +513,63 @@ def answer():
     _session = get_session()
     save_session(_session)
 
+    versions = _session.versions
+    source = f'{versions["meta_data"]}-{versions["restriction"]}'
+    etag = make_etag(_session, 'answer', source)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
     meta_data = _session.meta_data
     meta_data.set_active_menu(MenuTypes.ANSWER)
 
-    result = LpSolve(Data(meta_data, _session.restriction)).result
+    if versions['result_source'] == source:
+        # Метаданные и ограничения не менялись с последнего решения.
+        result = _session.result
+    else:
+        from server.history import settings_hash
 
-    _session.meta_data = meta_data
-    _session.result = result
+        restriction = _session.restriction
+        settings = settings_hash(meta_data, restriction)
+        entry = _session.history.find(settings)
+        # С такими настройками задача уже решалась - результат берётся из истории.
+        result = _session.history.get_result(entry['id']) if entry is not None else None
+        if result is None:
+            result = submit(meta_data, restriction)
+            _session.history.add(settings, meta_data, restriction, result)
+
+        _session.result = result
+        _session.set_result_source(source)
 
-    return render_template('answer.html', meta_data=meta_data, result=result)
+    return with_etag(render('answer.html', meta_data=meta_data, result=result), etag)
+
+
+@app.route('/history')
+def history():
+    """
+    Формирует страницу сравнения результатов из истории сессии.
+    """
+
+    _session = get_session()
+    save_session(_session)
+
+    meta_data = _session.meta_data
+    meta_data.set_active_menu(MenuTypes.HISTORY)
+
+    rows = _session.history.compare(request.args.get('base'))
+    return render('history.html', meta_data=meta_data, rows=rows)
+
+
+@app.route('/api/history')
+def api_history():
+    """
+    Отдаёт историю результатов сессии со сравнением относительно записи base (по умолчанию последней).
+    """
+
+    _session = get_session()
+    save_session(_session)
+
+    return jsonify({'entries': _session.history.compare(request.args.get('base'))})
 
 
 @app.route('/restrictions', methods=['GET'])
@@ -180,16 +577,23 @@ def restrictions():
     _session = get_session()
     save_session(_session)
 
+    versions = _session.versions
+    etag = make_etag(_session, 'restrictions', versions['meta_data'], versions['restriction'])
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
     meta_data = _session.meta_data
     meta_data.set_active_menu(MenuTypes.RESTRICTIONS)
 
     restriction = _session.restriction
-    restriction.x = len(meta_data.get_load_data_free_chlen_len()) - 1
+    x = len(meta_data.get_load_data_free_chlen_len()) - 1
+    if restriction.x != x:
+        restriction.resize(x)
+        _session.restriction = restriction
+        etag = make_etag(_session, 'restrictions', _session.versions['meta_data'], _session.versions['restriction'])
 
-    _session.meta_data = meta_data
-    _session.restriction = restriction
-
-    return render_template('restrictions.html', meta_data=meta_data, restriction=restriction)
+    return with_etag(render('restrictions.html', meta_data=meta_data, restriction=restriction), etag)
 
 
 @app.route('/form/data', methods=["POST"])
@@ -201,40 +605,269 @@ def form_data():
     _session = get_session()
     save_session(_session)
 
+    error = apply_data_form(_session)
+    if error:
+        return render_data_error(_session, error)
+    return redirect(url_for('answer'))
+
+
+def apply_data_form(_session: Session):
+    """
+    Применяет форму setData шаблона data.html к метаданным сессии.
+    :return: сообщение об ошибке или None.
+    """
+
     meta_data = _session.meta_data
-    meta_data.set_data(request.form)
+    try:
+        meta_data.set_data(request.form)
+    except ValueError as e:
+        return str(e)
 
     _session.meta_data = meta_data
-    return redirect(url_for('answer'))
+    sync_restriction(_session)
+    return None
 
 
-@app.route('/form/data_restrictions', methods=['POST'])
-def form_data_restrictions():
+def sync_restriction(_session: Session):
+    """
+    Приводит количество коэффициентов в ограничениях к текущим параметрам данных
+    (свободный член, столбец весов).
+    """
+
+    meta_data = _session.meta_data
+    restriction = _session.restriction
+    x = len(meta_data.get_load_data_free_chlen_len()) - 1
+    if restriction.x != x:
+        restriction.resize(x)
+        _session.restriction = restriction
+
+
+def render_data_error(_session: Session, error: str):
+    """
+    Формирует страницу данных с сообщением об ошибке в параметрах.
+    """
+
+    meta_data = _session.meta_data
+    meta_data.set_active_menu(MenuTypes.DATA)
+    return render('data.html', meta_data=meta_data, page=1, page_size=PAGE_SIZE, error=error)
+
+
+def parse_taus(value) -> list:
+    """
+    Разбирает квантили для решения с несколькими τ.
+    :param value: значения через запятую или пробел, либо список; пустое значение - QUANTILES_DEFAULT.
+    :return: квантили без повторов по возрастанию: соседние τ решаются от предыдущего решения.
+    :raises ValueError: значение не число или вне (0, 1).
+    """
+
+    if isinstance(value, str):
+        value = value.replace(',', ' ').split()
+    if not value:
+        return list(QUANTILES_DEFAULT)
+
+    try:
+        taus = sorted(set(float(item) for item in value))
+    except (TypeError, ValueError):
+        raise ValueError('Квантили должны быть числами.')
+    for tau in taus:
+        MetaData.check_tau(tau)
+    return taus
+
+
+def parse_responses(value, cols: int) -> list:
+    """
+    Разбирает номера столбцов-откликов для построения моделей по всем откликам.
+    :param value: номера через запятую или пробел, либо список; пустое значение - все столбцы.
+    :param cols: количество столбцов загруженной матрицы.
+    :return: номера столбцов без повторов, начинаются с 1.
+    :raises ValueError: номер не является целым числом или вне диапазона столбцов.
+    """
+
+    if isinstance(value, str):
+        value = value.replace(',', ' ').split()
+    if not value:
+        return list(range(1, cols + 1))
+
+    try:
+        responses = list(dict.fromkeys(int(item) for item in value))
+    except (TypeError, ValueError):
+        raise ValueError('Номера столбцов-откликов должны быть целыми числами.')
+    if any(response < 1 or response > cols for response in responses):
+        raise ValueError(f'Номера столбцов-откликов должны быть от 1 до {cols}.')
+    if cols < 2:
+        raise ValueError('Для построения моделей нужно хотя бы два столбца.')
+    return responses
+
+
+@app.route('/form/multi', methods=['POST'])
+def form_multi():
+    """
+    Обрабатывает форму setData в шаблоне data.html: строит модели, в которых
+    откликом по очереди выступает каждый из выбранных столбцов.
+    """
+
+    _session = get_session()
+    save_session(_session)
+
+    error = apply_data_form(_session)
+    if error:
+        return render_data_error(_session, error)
+    meta_data = _session.meta_data
+    meta_data.set_active_menu(MenuTypes.DATA)
+
+    multi_result = None
+    try:
+        responses = parse_responses(request.form.get('responses'), meta_data.cols)
+    except ValueError as e:
+        error = str(e)
+    else:
+        multi_result = submit_all(meta_data, responses)
+
+    return render('multi.html', meta_data=meta_data, multi_result=multi_result, error=error)
+
+
+@app.route('/api/multi', methods=['POST'])
+def api_multi():
+    """
+    Строит модели по всем откликам без HTML. Параметры free_chlen, delta и solver
+    берутся из сессии (задаются формой data.html), номера столбцов-откликов - из поля responses тела JSON
+    (по умолчанию все столбцы).
+    """
+
+    from server.lp import MultiResult
+
     _session = get_session()
     save_session(_session)
 
     meta_data = _session.meta_data
-    meta_data.set_data(request.form)
+    if not meta_data.has_load_data():
+        return jsonify({'error': 'Сначала загрузите исходные данные.'}), 400
+    if meta_data.delta is None:
+        # Параметры данных ещё не задавались: значения по умолчанию формы data.html.
+        meta_data.set_data({})
+        _session.meta_data = meta_data
+    try:
+        responses = parse_responses((request.get_json(silent=True) or {}).get('responses'), meta_data.cols)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    multi_result = submit_all(meta_data, responses)
+    return Response(json.dumps(multi_result, cls=MultiResult.DataEncoder), mimetype='application/json')
+
+
+@app.route('/form/quantiles', methods=['POST'])
+def form_quantiles():
+    """
+    Обрабатывает форму setData в шаблоне data.html: решает задачу с текущими
+    ограничениями для нескольких квантилей τ.
+    """
 
-    _session.meta_data = meta_data
+    _session = get_session()
+    save_session(_session)
 
+    error = apply_data_form(_session)
+    if error:
+        return render_data_error(_session, error)
+    meta_data = _session.meta_data
+    meta_data.set_active_menu(MenuTypes.DATA)
+
+    rows = None
+    try:
+        taus = parse_taus(request.form.get('taus'))
+    except ValueError as e:
+        error = str(e)
+    else:
+        rows = list(zip(taus, submit_quantiles(meta_data, _session.restriction, taus)))
+
+    return render('quantiles.html', meta_data=meta_data, rows=rows, error=error)
+
+
+@app.route('/api/quantiles', methods=['POST'])
+def api_quantiles():
+    """
+    Решает задачу для нескольких квантилей без HTML: квантили - поле taus тела JSON
+    (по умолчанию QUANTILES_DEFAULT), остальные параметры и ограничения берутся из сессии.
+    """
+
+    _session = get_session()
+    save_session(_session)
+
+    meta_data = _session.meta_data
+    if not meta_data.has_load_data() or meta_data.delta is None:
+        return jsonify({'error': 'Сначала загрузите исходные данные и задайте параметры.'}), 400
+    try:
+        taus = parse_taus((request.get_json(silent=True) or {}).get('taus'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = submit_quantiles(meta_data, _session.restriction, taus)
+    return jsonify({'models': [dict(result.summary(), tau=tau) for tau, result in zip(taus, results)]})
+
+
+@app.route('/api/weights', methods=['POST'])
+def api_weights():
+    """
+    Задаёт веса наблюдений: {"column": номер столбца} выбирает столбец загруженной
+    матрицы (null - без весов), {"weights": [...]} дописывает веса к матрице новым столбцом.
+    """
+
+    _session = get_session()
+    save_session(_session)
+
+    body = request.get_json(silent=True) or {}
+    try:
+        if 'weights' in body:
+            meta_data = append_weights(_session, body['weights'])
+        else:
+            meta_data = _session.meta_data
+            if not meta_data.has_load_data():
+                raise ValueError('Сначала загрузите исходные данные.')
+            column = body.get('column')
+            if column is not None:
+                meta_data.check_weights_col(int(column), meta_data.var_y)
+            meta_data.weights_col = int(column) if column is not None else None
+            _session.meta_data = meta_data
+        sync_restriction(_session)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'dataset_id': meta_data.dataset_id, 'cols': meta_data.cols, 'weights_col': meta_data.weights_col})
+
+
+@app.route('/form/data_restrictions', methods=['POST'])
+def form_data_restrictions():
+    _session = get_session()
+    save_session(_session)
+
+    error = apply_data_form(_session)
+    if error:
+        return render_data_error(_session, error)
     return redirect(url_for('restrictions'))
 
 
-@app.route('/form/load_result', methods=["POST"])
+@app.route('/form/load_result', methods=["GET", "POST"])
 def form_load_result():
     _session = get_session()
     save_session(_session)
 
+    etag = make_etag(_session, 'result', _session.versions['result'])
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    from server.document import render_table
+
     result = _session.result
-    file_stream = render_table(result.print())
+    with metrics.timer('export'):
+        file_stream = render_table(result.print())
 
-    return send_file(
+    return with_etag(send_file(
         file_stream,
         as_attachment=True,
+        etag=False,
         download_name=f'result_'
                       f'{datetime.datetime.now(pytz.timezone("Asia/Irkutsk")).strftime("%Y-%m-%d_%H-%M-%S")}'
-                      f'.docx')
+                      f'.docx'), etag)
 
 
 @app.route('/form/restrictions', methods=['POST'])
@@ -250,6 +883,74 @@ def form_restrictions():
     return redirect(url_for('answer'))
 
 
+def import_restrictions(_session: Session, entries: list, operators: list, b: list):
+    """
+    Заменяет ограничения сессии импортированными.
+    :raises ValueError: данные не загружены или ограничения не согласованы с ними.
+    """
+
+    meta_data = _session.meta_data
+    if not meta_data.has_load_data():
+        raise ValueError('Сначала загрузите исходные данные.')
+
+    restriction = _session.restriction
+    restriction.resize(len(meta_data.get_load_data_free_chlen_len()) - 1)
+    restriction.set_entries(entries, operators, b)
+
+    _session.restriction = restriction
+    return restriction
+
+
+@app.route('/form/import_restrictions', methods=['POST'])
+def form_import_restrictions():
+    """
+    Обрабатывает загрузку файла с ограничениями.
+    """
+
+    from server.loader import load_restrictions
+
+    _session = get_session()
+    save_session(_session)
+
+    file = request.files.get('file')
+    try:
+        if not file:
+            raise ValueError('Выберите файл с ограничениями.')
+        import_restrictions(_session, *load_restrictions(file.stream.read()))
+    except ValueError as e:
+        meta_data = _session.meta_data
+        meta_data.set_active_menu(MenuTypes.RESTRICTIONS)
+        return render('restrictions.html', meta_data=meta_data, restriction=_session.restriction, error=str(e))
+
+    return redirect(url_for('restrictions'))
+
+
+@app.route('/api/restrictions', methods=['POST'])
+def api_restrictions():
+    """
+    Заменяет ограничения без HTML. Принимает JSON {"entries": [[строка, столбец, значение], ...],
+    "operators": [...], "b": [...]} либо файл в разреженной записи (поле file или тело запроса).
+    """
+
+    from server.loader import load_restrictions
+
+    _session = get_session()
+    save_session(_session)
+
+    body = request.get_json(silent=True)
+    try:
+        if isinstance(body, dict):
+            parsed = body.get('entries') or [], body.get('operators') or [], body.get('b') or []
+        else:
+            file = request.files.get('file')
+            parsed = load_restrictions(file.stream.read() if file else request.get_data())
+        restriction = import_restrictions(_session, *parsed)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'x': restriction.x, 'y': restriction.y, 'entries': len(restriction.entries)})
+
+
 @app.route('/form/add_restriction', methods=['POST'])
 def form_add_restriction():
     _session = get_session()
@@ -277,10 +978,33 @@ def form_remove_restriction():
     return redirect(url_for('restrictions'))
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Отдаёт метрики процесса в текстовом формате Prometheus.
+    """
+
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def prewarm():
+    """
+    Импортирует тяжёлые модули и запускает процессы решателя после старта сервера.
+    """
+
+    time.sleep(1)
+    from server import document  # noqa: F401
+    warm_up()
+
+
 if __name__ == '__main__':
     if SPACE == 'dev':
         app.run(host='0.0.0.0', debug=True)
     else:
         from waitress import serve
 
-        serve(app, host="0.0.0.0", port=5000)
+        if PREWARM:
+            # Тяжёлые зависимости (numpy, pulp, docxtpl) грузятся в фоне, пока сервер уже принимает запросы.
+            threading.Thread(target=prewarm, daemon=True).start()
+        serve(app, host="0.0.0.0", port=5000, threads=SERVE_THREADS,
+              connection_limit=SERVE_CONNECTION_LIMIT, backlog=SERVE_BACKLOG)
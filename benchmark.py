@@ -0,0 +1,429 @@
+"""
+Набор бенчмарков для конвейера решения задачи.
+
+Для каждого сочетания параметров генерируется воспроизводимый (по seed)
+синтетический набор данных, после чего отдельно замеряется время этапов:
+разбор файла, построение Data, построение модели, решение, Result.calculation
+и выгрузка результата в docx. Каждый случай выполняется в отдельном процессе
+с ограничением по времени, результаты выводятся в формате JSON.
+
+Пример запуска:
+    python benchmark.py --quick
+    python benchmark.py --n 100 1000 --p 1 5 --output bench.json
+    python benchmark.py --n 100000 --p 5 --solver exact fast
+    python benchmark.py --n 10000 100000 --p 5 --precision float64 float32
+    python benchmark.py --n 10 --p 1 --disk-dataset-gb 1 --redis fake
+"""
+
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from queue import Empty
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+os.environ.setdefault('BASE_DIR', os.path.join(BASE_DIR, 'resources'))
+
+DEFAULT_N = [10, 100, 1000, 10000, 100000]
+DEFAULT_P = [1, 5, 20, 50]
+QUICK_N = [10, 100, 1000]
+QUICK_P = [1, 5]
+
+
+def generate_dataset(n: int, p: int, seed: int) -> bytes:
+    """
+    Генерирует текстовый файл с исходными данными в формате загрузки /load.
+    Первый столбец - зависимая переменная, остальные p столбцов - регрессоры.
+    :param n: количество наблюдений.
+    :param p: количество регрессоров.
+    :param seed: начальное значение генератора.
+    :return: содержимое файла.
+    """
+
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(1, 10, size=(n, p))
+    alpha = rng.uniform(-2, 2, size=p)
+    y = x @ alpha + 5 + rng.laplace(0, 1, size=n)
+    matrix = np.column_stack([y, x])
+
+    stream = io.BytesIO()
+    np.savetxt(stream, matrix, fmt='%.6f')
+    return stream.getvalue()
+
+
+def build_meta_data(matrix: np.ndarray, free_chlen: bool):
+    from server.meta_data import MetaData
+
+    meta_data = MetaData({
+        'free_chlen': free_chlen,
+        'delta': 0.1,
+        'var_y': 1,
+    })
+    meta_data.set_load_data(matrix)
+    return meta_data
+
+
+def build_restriction(meta_data, with_restrictions: bool):
+    """
+    Формирует ограничения для случая: сумма коэффициентов не больше 10
+    и первый коэффициент при регрессоре неотрицателен.
+    """
+    from server.meta_data import Restriction, OperatorEnum
+
+    restriction = Restriction()
+    restriction.x = len(meta_data.get_load_data_free_chlen_len()) - 1
+    if not with_restrictions:
+        return restriction
+
+    first = 1 if meta_data.free_chlen else 0
+    entries = [(0, index, 1.0) for index in range(restriction.x)] + [(1, first, 1.0)]
+    restriction.set_entries(entries, [OperatorEnum.LESS_OR_EQUAL, OperatorEnum.MORE_OR_EQUAL], [10.0, 0.0])
+    return restriction
+
+
+def run_case(case: dict, queue):
+    """
+    Выполняет один случай и отправляет в очередь время каждого этапа
+    сразу после его завершения, чтобы при превышении времени сохранить
+    уже полученные замеры.
+    """
+
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+    from server.document import render_table
+    from server.loader import load_matrix
+    from server.lp import Data, LpSolve, FastLpSolve, Result
+
+    content = generate_dataset(case['n'], case['p'], case['seed'])
+
+    def stage(name, func):
+        start = time.perf_counter()
+        value = func()
+        queue.put(('stage', name, time.perf_counter() - start))
+        return value
+
+    matrix = stage('parse', lambda: load_matrix(content, np.dtype(case['precision'])))
+    meta_data = build_meta_data(matrix, case['free_chlen'])
+    restriction = build_restriction(meta_data, case['restrictions'])
+
+    data = stage('data', lambda: Data(meta_data, restriction))
+    solver_class = FastLpSolve if case['solver'] == 'fast' else LpSolve
+    solver = stage('build', lambda: solver_class(data, execute=False))
+    stage('solve', solver.execute)
+    stage('calculation', solver.calculation)
+    stage('export', lambda: render_table(solver.result.print()))
+
+    queue.put(('result', {
+        'e': solver.result.e,
+        'osp': solver.result.osp,
+        'm': solver.result.m,
+        'a': solver.result.a,
+        'objective_gap': solver.result.stats.get('objective_gap'),
+        'matrix_bytes': matrix.nbytes,
+        'result_bytes': len(json.dumps(solver.result, cls=Result.DataEncoder)),
+    }))
+
+
+def execute_case(case: dict, timeout: float) -> dict:
+    report = dict(case)
+    report['stages'] = {}
+    report['status'] = 'ok'
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_case, args=(case, queue))
+    start = time.perf_counter()
+    process.start()
+
+    while True:
+        left = timeout - (time.perf_counter() - start)
+        if left <= 0:
+            process.kill()
+            report['status'] = 'timeout'
+            break
+        try:
+            message = queue.get(timeout=min(left, 0.5))
+        except Empty:
+            if not process.is_alive() and queue.empty():
+                if process.exitcode != 0:
+                    report['status'] = 'error'
+                    report['exitcode'] = process.exitcode
+                break
+            continue
+
+        if message[0] == 'stage':
+            report['stages'][message[1]] = message[2]
+        elif message[0] == 'result':
+            report['result'] = message[1]
+            break
+
+    process.join()
+    report['total'] = time.perf_counter() - start
+    return report
+
+
+def measure_import(statement: str, repeats: int) -> float:
+    """
+    Замеряет время импорта в новом интерпретаторе (лучшее из repeats запусков).
+    """
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], cwd=BASE_DIR, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def measure_startup(budget: float, repeats: int = 5) -> dict:
+    """
+    Замеряет холодный старт приложения: импорт app.py без тяжёлых зависимостей,
+    отдельно импорт numpy, pulp и docxtpl, которые грузятся при первом обращении.
+    """
+
+    interpreter = measure_import('pass', repeats)
+    app = measure_import('import app', repeats)
+    heavy = measure_import('import numpy, pulp, docxtpl', repeats)
+    return {
+        'interpreter': interpreter,
+        'import_app': app,
+        'import_heavy': heavy,
+        'budget': budget,
+        'within_budget': app <= budget,
+    }
+
+
+def measure_disk_dataset(size_gb: float, cols: int, page_size: int, directory: str, seed: int) -> dict:
+    """
+    Проверяет хранилище на диске (DiskDatasetStore) на синтетическом наборе размером size_gb.
+    Исходный файл пишется блоками без загрузки в память и передаётся в put как memory map:
+    замеряются хэширование, запись в хранилище и учёт в Redis, затем get и чтение отдельных
+    страниц (рост RSS показывает, что читаются только они) и вытеснение набора без ссылок.
+    """
+    from server.dataset import DiskDatasetStore
+    from server.meta_data import MetaData
+
+    rows = int(size_gb * 1024 ** 3) // (8 * cols)
+    path = os.path.join(directory, f'benchmark_{rows}x{cols}.npy')
+    store_dir = tempfile.mkdtemp(prefix='benchmark_store_', dir=directory)
+    token = f'benchmark:{os.getpid()}'
+    rng = np.random.default_rng(seed)
+    chunk = max(1, (64 * 1024 ** 2) // (8 * cols))
+
+    start = time.perf_counter()
+    matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(rows, cols))
+    for offset in range(0, rows, chunk):
+        end = min(offset + chunk, rows)
+        matrix[offset:end] = rng.uniform(1, 10, size=(end - offset, cols))
+    matrix.flush()
+    del matrix
+    generate_time = time.perf_counter() - start
+
+    try:
+        store = DiskDatasetStore(store_dir)
+
+        start = time.perf_counter()
+        dataset_id = store.put(np.load(path, mmap_mode='r'), token)
+        put_time = time.perf_counter() - start
+
+        rss_before = _current_rss()
+
+        start = time.perf_counter()
+        meta_data = MetaData()
+        meta_data.set_load_data(store.get(dataset_id), dataset_id)
+        open_time = time.perf_counter() - start
+
+        pages = {}
+        last_page = meta_data.get_pages_count(page_size)
+        for name, page in (('first', 1), ('middle', last_page // 2 + 1), ('last', last_page)):
+            start = time.perf_counter()
+            meta_data.get_load_data_page(page, page_size)
+            pages[name] = time.perf_counter() - start
+
+        rss_after = _current_rss()
+        del meta_data
+
+        store.unref(dataset_id, token)
+        store.max_bytes = 0
+        start = time.perf_counter()
+        store.evict()
+        evict_time = time.perf_counter() - start
+        evicted = store.get(dataset_id) is None
+    finally:
+        os.remove(path)
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    return {
+        'rows': rows,
+        'cols': cols,
+        'bytes': rows * cols * 8,
+        'generate': generate_time,
+        'put': put_time,
+        'open': open_time,
+        'pages': pages,
+        'page_size': page_size,
+        'rss_growth_kb': rss_after - rss_before,
+        'evict': evict_time,
+        'evicted': evicted,
+    }
+
+
+def _current_rss() -> int:
+    """
+    Текущий RSS процесса в КБ (VmRSS); без /proc - пиковый RSS.
+    """
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def setup_redis(kind: str):
+    """
+    Подключает Redis для проверки хранилища: из конфигурации или fakeredis.
+    """
+    if kind != 'fake':
+        return
+
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit('Для --redis fake необходим пакет fakeredis (pip install -r requirements-dev.txt).')
+
+    from server import redis_client
+
+    server = fakeredis.FakeServer()
+    redis_client.set_pools({
+        True: fakeredis.FakeRedis(server=server, decode_responses=True).connection_pool,
+        False: fakeredis.FakeRedis(server=server, decode_responses=False).connection_pool,
+    })
+
+
+def compare_precision(cases: list) -> list:
+    """
+    Сравнивает случаи с матрицей float32 с такими же случаями в float64:
+    сэкономленная память матрицы и результата (JSON сессии) и потеря точности α, E, M и КСП.
+    """
+
+    def key(case):
+        return tuple(case[name] for name in ('solver', 'n', 'p', 'free_chlen', 'restrictions', 'seed'))
+
+    baselines = {key(case): case for case in cases if case['precision'] == 'float64' and 'result' in case}
+    comparisons = []
+    for case in cases:
+        base = baselines.get(key(case))
+        if case['precision'] == 'float64' or base is None or 'result' not in case:
+            continue
+
+        result, base_result = case['result'], base['result']
+        comparisons.append({
+            'solver': case['solver'],
+            'n': case['n'],
+            'p': case['p'],
+            'free_chlen': case['free_chlen'],
+            'restrictions': case['restrictions'],
+            'precision': case['precision'],
+            'matrix_bytes_saved': base_result['matrix_bytes'] - result['matrix_bytes'],
+            'result_bytes_saved': base_result['result_bytes'] - result['result_bytes'],
+            'a_max_abs_diff': float(np.max(np.abs(np.subtract(result['a'], base_result['a'])))),
+            'e_diff': result['e'] - base_result['e'],
+            'm_rel_diff': (result['m'] - base_result['m']) / base_result['m'] if base_result['m'] else None,
+            'osp_diff': result['osp'] - base_result['osp'],
+        })
+    return comparisons
+
+
+def build_cases(args) -> list:
+    n_values = args.n if args.n else (QUICK_N if args.quick else DEFAULT_N)
+    p_values = args.p if args.p else (QUICK_P if args.quick else DEFAULT_P)
+
+    cases = []
+    for solver, n, p, free_chlen, restrictions, precision in itertools.product(
+            args.solver, n_values, p_values, [False, True], [False, True], args.precision):
+        cases.append({
+            'solver': solver,
+            'n': n,
+            'p': p,
+            'free_chlen': free_chlen,
+            'restrictions': restrictions,
+            'precision': precision,
+            'seed': args.seed,
+        })
+    return cases
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк конвейера решения МНМ.')
+    parser.add_argument('--n', type=int, nargs='+', help='количество наблюдений')
+    parser.add_argument('--p', type=int, nargs='+', help='количество регрессоров')
+    parser.add_argument('--seed', type=int, default=42, help='начальное значение генератора')
+    parser.add_argument('--timeout', type=float, default=300, help='ограничение по времени на случай, с')
+    parser.add_argument('--solver', nargs='+', choices=['exact', 'fast'], default=['exact'],
+                        help='метод решения: точный ЛП или быстрый IRLS с уточнением')
+    parser.add_argument('--precision', nargs='+', choices=['float64', 'float32'], default=['float64'],
+                        help='точность хранения матрицы; float32 сравнивается с float64 того же случая')
+    parser.add_argument('--quick', action='store_true', help='малая сетка параметров')
+    parser.add_argument('--startup-budget', type=float, default=1.0, help='бюджет на импорт app.py, с')
+    parser.add_argument('--disk-dataset-gb', type=float,
+                        help='проверить хранилище на диске на синтетическом файле такого размера, ГБ')
+    parser.add_argument('--disk-dataset-dir', default=tempfile.gettempdir(), help='каталог для синтетического файла')
+    parser.add_argument('--redis', choices=['config', 'fake'], default='config',
+                        help='Redis для учёта наборов в хранилище на диске: из конфигурации или fakeredis')
+    parser.add_argument('--output', help='файл для записи JSON, по умолчанию stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'seed': args.seed,
+        'timeout': args.timeout,
+        'startup': measure_startup(args.startup_budget),
+        'cases': [],
+    }
+
+    if args.disk_dataset_gb:
+        setup_redis(args.redis)
+        report['disk_dataset'] = measure_disk_dataset(
+            args.disk_dataset_gb, max(args.p or QUICK_P) + 1, 100, args.disk_dataset_dir, args.seed)
+
+    for case in build_cases(args):
+        result = execute_case(case, args.timeout)
+        report['cases'].append(result)
+        print(f"solver={case['solver']} n={case['n']} p={case['p']} free_chlen={case['free_chlen']} "
+              f"restrictions={case['restrictions']} precision={case['precision']}: "
+              f"{result['status']} {result['total']:.3f}s", file=sys.stderr)
+
+    if len(args.precision) > 1:
+        report['precision'] = compare_precision(report['cases'])
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
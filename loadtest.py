@@ -0,0 +1,336 @@
+"""
+Нагрузочный тест маршрутов приложения.
+
+Каждый виртуальный пользователь проходит сценарий: главная страница, загрузка
+файла, параметры данных, ответ, редактирование ограничений, повторный ответ
+и выгрузка результата в docx. Пользователи работают параллельно в потоках.
+В отчёте для каждого маршрута - количество запросов, ошибки и p50/p95/p99,
+а по метрикам /metrics - обращения к Redis за запрос и ожидание в очереди решателя.
+
+Приложение запускается в этом же процессе с Redis из конфигурации (например,
+из docker-compose.yml) или с fakeredis (--redis fake, requirements-dev.txt),
+либо тестируется развёрнутый сервер по --url.
+
+Пример запуска:
+    python loadtest.py --redis fake --users 8 --iterations 5
+    python loadtest.py --redis fake --queue-workers 2 --users 16
+    python loadtest.py --url http://localhost:5005 --users 32 --output load.json
+"""
+
+import argparse
+import collections
+import http.cookiejar
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+os.environ.setdefault('BASE_DIR', os.path.join(BASE_DIR, 'resources'))
+
+METRIC_LINE = re.compile(r'^(\w+)(\{[^}]*\})? (\S+)$')
+
+
+class FlaskClient:
+    """
+    Клиент приложения в этом же процессе (тестовый клиент Flask).
+    """
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method: str, path: str, data: dict = None, files: dict = None) -> (int, bytes):
+        data = dict(data or {})
+        for name, (filename, content) in (files or {}).items():
+            data[name] = (io.BytesIO(content), filename)
+        response = self._client.open(path, method=method, data=data,
+                                     content_type='multipart/form-data' if files else None)
+        return response.status_code, response.get_data()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HttpClient:
+    """
+    HTTP-клиент развёрнутого сервера. Cookie сессии хранятся у каждого пользователя,
+    перенаправления не выполняются, чтобы каждый запрос замерялся отдельно.
+    """
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method: str, path: str, data: dict = None, files: dict = None) -> (int, bytes):
+        body, content_type = None, None
+        if files:
+            body, content_type = _encode_multipart(data or {}, files)
+        elif data is not None:
+            body, content_type = urllib.parse.urlencode(data).encode(), 'application/x-www-form-urlencoded'
+
+        request = urllib.request.Request(self.url + path, data=body, method=method)
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        try:
+            with self._opener.open(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def _encode_multipart(data: dict, files: dict) -> (bytes, str):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in data.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def generate_dataset(n: int, p: int, seed: int) -> bytes:
+    """
+    Генерирует текстовый файл для загрузки: первый столбец - зависимая переменная.
+    """
+
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(1, 10, size=(n, p))
+    y = x @ rng.uniform(-2, 2, size=p) + 5 + rng.laplace(0, 1, size=n)
+
+    stream = io.BytesIO()
+    np.savetxt(stream, np.column_stack([y, x]), fmt='%.6f')
+    return stream.getvalue()
+
+
+def journey(client, content: bytes, p: int, record):
+    """
+    Один проход сценария пользователя.
+    :param record: функция record(route, seconds, status).
+    """
+
+    def call(route, method, path, data=None, files=None):
+        start = time.perf_counter()
+        try:
+            status, _ = client.request(method, path, data, files)
+        except Exception:
+            status = 0
+        record(route, time.perf_counter() - start, status)
+
+    restriction = {f'a_0_{index}': 1 for index in range(p + 1)}
+    restriction.update({'b_0': 10, 'operator_0': 'LESS_OR_EQUAL'})
+
+    call('GET /', 'GET', '/')
+    call('POST /load', 'POST', '/load', files={'file': ('data.txt', content)})
+    call('POST /form/data', 'POST', '/form/data', data={'var_y': 1, 'delta': 0.1, 'free_chlen': 'on'})
+    call('GET /answer', 'GET', '/answer')
+    call('GET /restrictions', 'GET', '/restrictions')
+    call('POST /form/restrictions', 'POST', '/form/restrictions', data=restriction)
+    call('GET /answer', 'GET', '/answer')
+    call('POST /form/load_result', 'POST', '/form/load_result')
+
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) if values else None
+
+
+def parse_metrics(text: str) -> dict:
+    """
+    Разбирает метрики в текстовом формате Prometheus: {(имя, метки): значение}.
+    """
+
+    values = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            values[(match.group(1), match.group(2) or '')] = float(match.group(3))
+    return values
+
+
+def summarize_metrics(before: dict, after: dict) -> dict:
+    """
+    Считает по разнице метрик до и после теста обращения к Redis за запрос
+    по каждому маршруту и ожидание задач в очереди решателя.
+    """
+
+    def delta(name, labels):
+        return after.get((name, labels), 0) - before.get((name, labels), 0)
+
+    redis_ops = {}
+    for name, labels in after:
+        if name == 'mnm_redis_roundtrips_per_request_count':
+            count = delta(name, labels)
+            if count:
+                endpoint = re.search(r'endpoint="([^"]*)"', labels).group(1)
+                redis_ops[endpoint] = delta('mnm_redis_roundtrips_per_request_sum', labels) / count
+
+    labels = '{stage="queue_wait"}'
+    count = delta('mnm_stage_seconds_count', labels)
+    queue_wait = {
+        'count': int(count),
+        'mean': delta('mnm_stage_seconds_sum', labels) / count if count else None,
+    }
+    return {'redis_ops_per_request': redis_ops, 'queue_wait': queue_wait}
+
+
+def setup_in_process(args):
+    """
+    Импортирует приложение в этом процессе. Для fakeredis решатель работает в потоках
+    этого процесса: процессы пула не видят данные fakeredis.
+    """
+
+    if args.redis == 'fake':
+        os.environ['SOLVE_WORKERS'] = '0'
+        # Решения идут в потоках запросов: очередь должна вмещать всех пользователей.
+        os.environ.setdefault('SOLVE_QUEUE_DEPTH', str(args.users))
+    if args.queue_workers:
+        os.environ['SOLVE_BACKEND'] = 'queue'
+
+    from server import redis_client
+
+    if args.redis == 'fake':
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit('Для --redis fake необходим пакет fakeredis (pip install -r requirements-dev.txt).')
+
+        server = fakeredis.FakeServer()
+        redis_client.set_pools({
+            True: fakeredis.FakeRedis(server=server, decode_responses=True).connection_pool,
+            False: fakeredis.FakeRedis(server=server, decode_responses=False).connection_pool,
+        })
+
+    import app
+
+    workers = []
+    if args.queue_workers:
+        from server.job_queue import Worker
+
+        for _ in range(args.queue_workers):
+            worker = Worker(poll_timeout=1)
+            threading.Thread(target=worker.run, daemon=True).start()
+            workers.append(worker)
+
+    return lambda: FlaskClient(app.app), workers
+
+
+def run(args) -> dict:
+    if args.url:
+        make_client, workers = (lambda: HttpClient(args.url)), []
+    else:
+        make_client, workers = setup_in_process(args)
+
+    content = generate_dataset(args.n, args.p, args.seed)
+    samples = {}
+    lock = threading.Lock()
+
+    def record(route, seconds, status):
+        with lock:
+            samples.setdefault(route, []).append((seconds, status))
+
+    def user():
+        client = make_client()
+        for _ in range(args.iterations):
+            journey(client, content, args.p, record)
+            if args.think_time:
+                time.sleep(args.think_time)
+
+    metrics_client = make_client()
+    before = parse_metrics(metrics_client.request('GET', '/metrics')[1].decode())
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user) for _ in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    after = parse_metrics(metrics_client.request('GET', '/metrics')[1].decode())
+    for worker in workers:
+        worker.stop()
+
+    routes = {}
+    for route, values in samples.items():
+        seconds = [value for value, status in values if 200 <= status < 400]
+        routes[route] = {
+            'count': len(values),
+            'errors': sum(1 for _, status in values if not 200 <= status < 400),
+            'statuses': dict(collections.Counter(str(status) for _, status in values)),
+            'p50': percentile(seconds, 50),
+            'p95': percentile(seconds, 95),
+            'p99': percentile(seconds, 99),
+            'max': max(seconds) if seconds else None,
+        }
+
+    report = {
+        'target': args.url or f'in-process ({args.redis} redis)',
+        'users': args.users,
+        'iterations': args.iterations,
+        'n': args.n,
+        'p': args.p,
+        'queue_workers': args.queue_workers,
+        'duration': duration,
+        'requests_per_second': sum(route['count'] for route in routes.values()) / duration,
+        'routes': routes,
+    }
+    report.update(summarize_metrics(before, after))
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный тест маршрутов МНМ.')
+    parser.add_argument('--url', help='адрес развёрнутого сервера; без него приложение запускается в этом процессе')
+    parser.add_argument('--redis', choices=['config', 'fake'], default='config',
+                        help='Redis для приложения в этом процессе: из конфигурации или fakeredis')
+    parser.add_argument('--queue-workers', type=int, default=0,
+                        help='решать задачи через очередь этим количеством воркеров в потоках процесса')
+    parser.add_argument('--users', type=int, default=4, help='количество параллельных пользователей')
+    parser.add_argument('--iterations', type=int, default=3, help='проходов сценария на пользователя')
+    parser.add_argument('--think-time', type=float, default=0, help='пауза между проходами, с')
+    parser.add_argument('--n', type=int, default=200, help='количество наблюдений в загружаемом файле')
+    parser.add_argument('--p', type=int, default=3, help='количество регрессоров в загружаемом файле')
+    parser.add_argument('--seed', type=int, default=42, help='начальное значение генератора')
+    parser.add_argument('--output', help='файл для записи JSON, по умолчанию stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    stdout = sys.stdout
+    if not args.url:
+        # Решатель CBC пишет журнал в stdout процесса: переводим его в stderr, чтобы не портить JSON.
+        stdout = os.fdopen(os.dup(1), 'w')
+        os.dup2(2, 1)
+
+    report = run(args)
+
+    for route, stats in report['routes'].items():
+        print(f"{route}: {stats['count']} запросов, {stats['errors']} ошибок, "
+              f"p50={stats['p50']} p95={stats['p95']} p99={stats['p99']}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output, file=stdout)
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
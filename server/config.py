@@ -7,3 +7,107 @@ REDIS_HOST = os.environ.get('REDIS_HOST') if os.environ.get('SECRET_FLASK') is n
 REDIS_PORT = os.environ.get("REDIS_PORT") if os.environ.get('SECRET_FLASK') is not None else '6379'
 
 SPACE = os.environ.get("SPACE") if os.environ.get('SECRET_FLASK') is not None else 'dev'
+
+# Профилирование запросов по заголовку X-Profile (cProfile). Включать только для отладки.
+PROFILING = os.environ.get('PROFILING') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+
+# Модель обслуживания: потоки waitress обслуживают ввод-вывод, а решение задач
+# выполняется в отдельном пуле процессов, чтобы не делить GIL со страницами.
+SOLVE_WORKERS = int(os.environ.get('SOLVE_WORKERS')) if os.environ.get('SOLVE_WORKERS') is not None \
+    else os.cpu_count() or 1
+SOLVE_QUEUE_DEPTH = int(os.environ.get('SOLVE_QUEUE_DEPTH')) if os.environ.get('SOLVE_QUEUE_DEPTH') is not None \
+    else SOLVE_WORKERS * 2
+SOLVE_RETRY_AFTER = int(os.environ.get('SOLVE_RETRY_AFTER')) if os.environ.get('SOLVE_RETRY_AFTER') is not None \
+    else 5
+
+# Потоков должно хватать на все ожидающие решения запросы и ещё на обычные страницы.
+SERVE_THREADS = int(os.environ.get('SERVE_THREADS')) if os.environ.get('SERVE_THREADS') is not None \
+    else SOLVE_WORKERS + SOLVE_QUEUE_DEPTH + 4
+SERVE_CONNECTION_LIMIT = int(os.environ.get('SERVE_CONNECTION_LIMIT')) \
+    if os.environ.get('SERVE_CONNECTION_LIMIT') is not None else 100
+SERVE_BACKLOG = int(os.environ.get('SERVE_BACKLOG')) if os.environ.get('SERVE_BACKLOG') is not None else 1024
+
+# Фоновый прогрев тяжёлых зависимостей и пула решателя после старта сервера.
+PREWARM = os.environ.get('PREWARM') != '0'
+
+# Минимальный размер ответа в байтах, начиная с которого он сжимается gzip/br.
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE')) if os.environ.get('COMPRESS_MIN_SIZE') is not None \
+    else 1024
+
+# Размер LRU-кэша проверенных токенов сессий в каждом процессе, 0 - кэш отключён.
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE')) if os.environ.get('TOKEN_CACHE_SIZE') is not None \
+    else 10000
+
+# Ограничение общего объёма хранилища наборов данных, после которого
+# неиспользуемые наборы вытесняются (байты).
+DATASET_STORE_MAX_BYTES = int(os.environ.get('DATASET_STORE_MAX_BYTES')) \
+    if os.environ.get('DATASET_STORE_MAX_BYTES') is not None else 512 * 1024 * 1024
+
+# Хранилище наборов данных: redis - бинарные .npy в Redis,
+# disk - файлы .npy в DATA_DIR, открываемые через memory map.
+DATASET_BACKEND = os.environ.get('DATASET_BACKEND') if os.environ.get('DATASET_BACKEND') is not None else 'redis'
+DATA_DIR = os.environ.get('DATA_DIR') if os.environ.get('DATA_DIR') is not None \
+    else os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# Количество строк матрицы на одной странице просмотра.
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE')) if os.environ.get('PAGE_SIZE') is not None else 100
+
+# Максимальный размер загружаемого файла (байты).
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES')) \
+    if os.environ.get('UPLOAD_MAX_BYTES') is not None else 100 * 1024 * 1024
+
+# Быстрый решатель: точное уточнение выполняется по FAST_SOLVE_ROWS_FACTOR * p * sqrt(n)
+# наблюдениям с наименьшими остатками, не более FAST_SOLVE_ROUNDS раз.
+FAST_SOLVE_ROWS_FACTOR = float(os.environ.get('FAST_SOLVE_ROWS_FACTOR')) \
+    if os.environ.get('FAST_SOLVE_ROWS_FACTOR') is not None else 2.0
+FAST_SOLVE_ROUNDS = int(os.environ.get('FAST_SOLVE_ROUNDS')) \
+    if os.environ.get('FAST_SOLVE_ROUNDS') is not None else 5
+
+# Количество решённых моделей в каждом процессе решателя, которые можно дополнить
+# новыми строками без построения заново. 0 - не хранить. Задачи распределяются по
+# процессам без привязки к набору, поэтому кэш полезен только при одном процессе
+# решателя (SOLVE_WORKERS = 1 или один воркер очереди).
+SOLVE_MODEL_CACHE_SIZE = int(os.environ.get('SOLVE_MODEL_CACHE_SIZE')) \
+    if os.environ.get('SOLVE_MODEL_CACHE_SIZE') is not None else 0
+
+# Где решаются задачи: local - пул процессов веб-сервера, queue - отдельные
+# процессы worker.py, получающие задачи из очереди в Redis.
+SOLVE_BACKEND = os.environ.get('SOLVE_BACKEND') if os.environ.get('SOLVE_BACKEND') is not None else 'local'
+# Время (с), за которое воркер должен решить задачу или продлить её, иначе задача возвращается в очередь.
+QUEUE_VISIBILITY_TIMEOUT = int(os.environ.get('QUEUE_VISIBILITY_TIMEOUT')) \
+    if os.environ.get('QUEUE_VISIBILITY_TIMEOUT') is not None else 60
+QUEUE_MAX_ATTEMPTS = int(os.environ.get('QUEUE_MAX_ATTEMPTS')) \
+    if os.environ.get('QUEUE_MAX_ATTEMPTS') is not None else 3
+# Максимальная длина очереди, после которой новые задачи отклоняются (503).
+QUEUE_MAX_LENGTH = int(os.environ.get('QUEUE_MAX_LENGTH')) \
+    if os.environ.get('QUEUE_MAX_LENGTH') is not None else 100
+# Сколько веб-процесс ждёт результат задачи (с) и сколько результат хранится в Redis (с).
+QUEUE_WAIT_TIMEOUT = int(os.environ.get('QUEUE_WAIT_TIMEOUT')) \
+    if os.environ.get('QUEUE_WAIT_TIMEOUT') is not None else 600
+QUEUE_RESULT_TTL = int(os.environ.get('QUEUE_RESULT_TTL')) \
+    if os.environ.get('QUEUE_RESULT_TTL') is not None else 3600
+
+# Ограничения истории результатов одной сессии: общий размер (байты) и количество записей.
+HISTORY_MAX_BYTES = int(os.environ.get('HISTORY_MAX_BYTES')) \
+    if os.environ.get('HISTORY_MAX_BYTES') is not None else 8 * 1024 * 1024
+HISTORY_MAX_ENTRIES = int(os.environ.get('HISTORY_MAX_ENTRIES')) \
+    if os.environ.get('HISTORY_MAX_ENTRIES') is not None else 20
+
+# Квантили τ по умолчанию для решения с несколькими квантилями (через запятую).
+QUANTILES_DEFAULT = [float(item) for item in os.environ.get('QUANTILES_DEFAULT').split(',')] \
+    if os.environ.get('QUANTILES_DEFAULT') is not None else [0.1, 0.25, 0.5, 0.75, 0.9]
+
+# Ограничения одного решения в процессе решателя (rlimit): рост адресного пространства
+# (байты) и процессорное время (с); 0 - без ограничения. По SOLVE_MEMORY_LIMIT также
+# заранее отклоняются данные, модель для которых по прогнозу не поместится в память.
+SOLVE_MEMORY_LIMIT = int(os.environ.get('SOLVE_MEMORY_LIMIT')) \
+    if os.environ.get('SOLVE_MEMORY_LIMIT') is not None else 2 * 1024 * 1024 * 1024
+SOLVE_CPU_LIMIT = int(os.environ.get('SOLVE_CPU_LIMIT')) \
+    if os.environ.get('SOLVE_CPU_LIMIT') is not None else 300
+
+# Точность хранения загруженных матриц: float64 или float32. float32 вдвое уменьшает
+# объём наборов данных в хранилище и общей памяти, а также ошибок и расчётных значений
+# результата; решатель по-прежнему работает в float64.
+MATRIX_PRECISION = os.environ.get('MATRIX_PRECISION') \
+    if os.environ.get('MATRIX_PRECISION') is not None else 'float64'
@@ -0,0 +1,409 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+import uuid
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import numpy as np
+import redis
+
+from server.redis_client import get_redis
+from server.config import DATASET_STORE_MAX_BYTES, DATASET_BACKEND, DATA_DIR
+
+
+class DatasetStore(ABC):
+    """
+    Хранилище загруженных матриц с адресацией по содержимому.
+    Одинаковые загрузки разных пользователей хранятся один раз, сессии
+    ссылаются на набор данных по идентификатору (хэшу содержимого).
+    Ссылки считаются как множество токенов сессий, ссылающихся на набор;
+    наборы без живых ссылок вытесняются в порядке давности использования,
+    когда общий объём превышает DATASET_STORE_MAX_BYTES.
+    """
+
+    LRU_KEY = 'datasets:lru'
+    SIZE_KEY = 'datasets:size'
+    # Блокировка набора держится на время записи или дописывания; истекает сама,
+    # если процесс, взявший её, упал.
+    LOCK_TIMEOUT_MS = 60000
+
+    def __init__(self, max_bytes: int = DATASET_STORE_MAX_BYTES):
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def dataset_id(matrix: np.ndarray) -> str:
+        """
+        Вычисляет идентификатор набора: sha256 от формы, типа и байтов матрицы.
+        """
+        digest = hashlib.sha256(f'{matrix.shape}{matrix.dtype.str}'.encode())
+        digest.update(np.ascontiguousarray(matrix).data)
+        return digest.hexdigest()[:32]
+
+    def put(self, matrix: np.ndarray, token: str = None) -> str:
+        """
+        Сохраняет матрицу, если такой ещё нет, и возвращает её идентификатор.
+        :param matrix: матрица.
+        :param token: токен сессии, которая ссылается на набор. Ссылка добавляется
+                      до вытеснения, чтобы только что загруженный набор не был удалён.
+        """
+        dataset_id = self.dataset_id(matrix)
+        r = get_redis()
+        # Ссылка и проверка наличия выполняются под блокировкой набора: иначе
+        # одновременное дописывание на месте могло бы переименовать набор между ними.
+        with self._locked(dataset_id):
+            if token is not None:
+                self.ref(dataset_id, token)
+            if not r.hexists(self.SIZE_KEY, dataset_id):
+                size = self._write(dataset_id, matrix)
+                r.hset(self.SIZE_KEY, dataset_id, size)
+        r.zadd(self.LRU_KEY, {dataset_id: time.time()})
+
+        self.evict()
+        return dataset_id
+
+    @staticmethod
+    def appended_id(dataset_id: str, rows: np.ndarray) -> str:
+        """
+        Вычисляет идентификатор набора, дополненного строками: sha256 от идентификатора
+        родительского набора и дописанных строк, без чтения всей матрицы.
+        Идентификатор не совпадает с dataset_id той же матрицы, загруженной целиком:
+        такие наборы хранятся дважды. Зато одинаковые дописывания к одному набору
+        по-прежнему хранятся один раз.
+        """
+        digest = hashlib.sha256(f'{dataset_id}{rows.shape}{rows.dtype.str}'.encode())
+        digest.update(np.ascontiguousarray(rows).data)
+        return digest.hexdigest()[:32]
+
+    def append(self, dataset_id: str, rows: np.ndarray, token: str) -> str:
+        """
+        Дописывает строки к набору и возвращает идентификатор дополненного набора.
+        Если на набор ссылается только эта сессия, строки дописываются в конец
+        хранимого .npy на месте, а набор переименовывается: стоимость зависит только
+        от количества новых строк. Набор, общий с другими сессиями, копируется
+        целиком, а ссылка сессии на него сразу снимается. Проверка ссылок и дописывание
+        выполняются под блокировкой родительского набора, которую берёт и put.
+        :param dataset_id: идентификатор родительского набора.
+        :param rows: новые строки в типе набора (см. dtype).
+        :param token: токен сессии.
+        :return: идентификатор нового набора или None, если родительский набор вытеснен.
+        """
+        new_id = self.appended_id(dataset_id, rows)
+        self.ref(new_id, token)
+
+        r = get_redis()
+        if not r.hexists(self.SIZE_KEY, new_id):
+            size = None
+            with self._locked(dataset_id):
+                if self._alive_refs(dataset_id) == 1 and r.sismember(self._refs_key(dataset_id), token):
+                    size = self._extend(dataset_id, new_id, rows)
+                if size is not None:
+                    pipe = r.pipeline(transaction=True)
+                    pipe.delete(self._refs_key(dataset_id))
+                    pipe.hdel(self.SIZE_KEY, dataset_id)
+                    pipe.zrem(self.LRU_KEY, dataset_id)
+                    pipe.hset(self.SIZE_KEY, new_id, size)
+                    pipe.execute()
+            if size is None:
+                matrix = self._read(dataset_id)
+                if matrix is None:
+                    self.unref(new_id, token)
+                    return None
+                size = self._write(new_id, np.concatenate([matrix, rows]))
+                r.hset(self.SIZE_KEY, new_id, size)
+        r.zadd(self.LRU_KEY, {new_id: time.time()})
+        self.unref(dataset_id, token)
+
+        self.evict()
+        return new_id
+
+    def dtype(self, dataset_id: str):
+        """
+        Получает тип матрицы по заголовку .npy без чтения данных.
+        :return: тип или None, если набор был вытеснен.
+        """
+        header = self._read_header(dataset_id)
+        return header[2] if header is not None else None
+
+    def get(self, dataset_id: str) -> np.ndarray:
+        """
+        Получает матрицу по идентификатору.
+        :return: матрица или None, если набор был вытеснен.
+        """
+        matrix = self._read(dataset_id)
+        if matrix is not None:
+            get_redis().zadd(self.LRU_KEY, {dataset_id: time.time()})
+        return matrix
+
+    def ref(self, dataset_id: str, token: str):
+        get_redis().sadd(self._refs_key(dataset_id), token)
+
+    def unref(self, dataset_id: str, token: str):
+        get_redis().srem(self._refs_key(dataset_id), token)
+
+    def evict(self):
+        """
+        Вытесняет давно не использованные наборы без живых ссылок,
+        пока общий объём превышает ограничение.
+        """
+        r = get_redis()
+        sizes = {key: int(value) for key, value in r.hgetall(self.SIZE_KEY).items()}
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        for dataset_id in r.zrange(self.LRU_KEY, 0, -1):
+            if total <= self.max_bytes:
+                break
+            if self._alive_refs(dataset_id):
+                continue
+
+            self._delete(dataset_id)
+            pipe = r.pipeline(transaction=False)
+            pipe.delete(self._refs_key(dataset_id))
+            pipe.hdel(self.SIZE_KEY, dataset_id)
+            pipe.zrem(self.LRU_KEY, dataset_id)
+            pipe.execute()
+            total -= sizes.get(dataset_id, 0)
+
+    def _alive_refs(self, dataset_id: str) -> int:
+        """
+        Удаляет ссылки истёкших сессий и возвращает количество оставшихся.
+        """
+        r = get_redis()
+        tokens = list(r.smembers(self._refs_key(dataset_id)))
+        if not tokens:
+            return 0
+
+        pipe = r.pipeline(transaction=False)
+        for token in tokens:
+            pipe.exists(token)
+        dead = [token for token, exists in zip(tokens, pipe.execute()) if not exists]
+        if dead:
+            r.srem(self._refs_key(dataset_id), *dead)
+        return len(tokens) - len(dead)
+
+    @contextmanager
+    def _locked(self, dataset_id: str):
+        """
+        Держит блокировку набора в Redis (SET NX с истечением). Снимается только
+        своя блокировка: после истечения её мог взять другой процесс.
+        """
+        r = get_redis()
+        key, value = self._lock_key(dataset_id), uuid.uuid4().hex
+        while not r.set(key, value, nx=True, px=self.LOCK_TIMEOUT_MS):
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            with r.pipeline(transaction=True) as pipe:
+                try:
+                    pipe.watch(key)
+                    if pipe.get(key) == value:
+                        pipe.multi()
+                        pipe.delete(key)
+                        pipe.execute()
+                except redis.WatchError:
+                    pass
+
+    @staticmethod
+    def _refs_key(dataset_id: str) -> str:
+        return f'dataset:{dataset_id}:refs'
+
+    @staticmethod
+    def _lock_key(dataset_id: str) -> str:
+        return f'dataset:{dataset_id}:lock'
+
+    @abstractmethod
+    def _write(self, dataset_id: str, matrix: np.ndarray) -> int:
+        """
+        Записывает матрицу и возвращает занятый ею объём в байтах.
+        """
+
+    @abstractmethod
+    def _read(self, dataset_id: str):
+        """
+        Читает матрицу или возвращает None, если её нет.
+        """
+
+    @abstractmethod
+    def _delete(self, dataset_id: str):
+        pass
+
+    @abstractmethod
+    def _read_header(self, dataset_id: str):
+        """
+        Читает заголовок .npy: (форма, fortran_order, тип, длина заголовка) или None, если набора нет.
+        """
+
+    @abstractmethod
+    def _extend(self, dataset_id: str, new_id: str, rows: np.ndarray):
+        """
+        Дописывает строки в конец хранимого набора на месте и переименовывает его в new_id.
+        :return: новый объём в байтах или None, если дописать на месте нельзя.
+        """
+
+
+class RedisDatasetStore(DatasetStore):
+    """
+    Хранит матрицы в Redis в виде бинарных .npy.
+    """
+
+    def _write(self, dataset_id: str, matrix: np.ndarray) -> int:
+        stream = io.BytesIO()
+        np.save(stream, matrix, allow_pickle=False)
+        get_redis(decode_responses=False).set(self._blob_key(dataset_id), stream.getvalue())
+        return stream.getbuffer().nbytes
+
+    def _read(self, dataset_id: str):
+        blob = get_redis(decode_responses=False).get(self._blob_key(dataset_id))
+        if blob is None:
+            return None
+        return np.load(io.BytesIO(blob), allow_pickle=False)
+
+    def _delete(self, dataset_id: str):
+        get_redis().delete(self._blob_key(dataset_id))
+
+    def _read_header(self, dataset_id: str):
+        head = get_redis(decode_responses=False).getrange(self._blob_key(dataset_id), 0, HEADER_READ_BYTES - 1)
+        return _parse_header(io.BytesIO(head)) if head else None
+
+    def _extend(self, dataset_id: str, new_id: str, rows: np.ndarray):
+        header = self._read_header(dataset_id)
+        new_header = _extended_header(header, rows)
+        if new_header is None:
+            return None
+
+        # SETRANGE, APPEND и RENAME выполняются одной транзакцией.
+        pipe = get_redis(decode_responses=False).pipeline(transaction=True)
+        pipe.setrange(self._blob_key(dataset_id), 0, new_header)
+        pipe.append(self._blob_key(dataset_id), np.ascontiguousarray(rows).tobytes())
+        pipe.rename(self._blob_key(dataset_id), self._blob_key(new_id))
+        return pipe.execute()[1]
+
+    @staticmethod
+    def _blob_key(dataset_id: str) -> str:
+        return f'dataset:{dataset_id}'
+
+
+class DiskDatasetStore(DatasetStore):
+    """
+    Хранит матрицы файлами .npy в локальном каталоге и открывает их через
+    memory map: читаются только те страницы файла, к которым есть обращение.
+    Ссылки, размеры и порядок использования по-прежнему хранятся в Redis.
+    Все процессы решателя должны видеть один и тот же каталог.
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR, max_bytes: int = DATASET_STORE_MAX_BYTES):
+        super().__init__(max_bytes)
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+
+    def _write(self, dataset_id: str, matrix: np.ndarray) -> int:
+        path = self._path(dataset_id)
+        # Набор адресуется по содержимому: уже записанный файл - тот же набор.
+        if not os.path.exists(path):
+            # Запись в свой временный файл и атомарная замена: одновременные загрузки
+            # одного набора не мешают друг другу, читатели не увидят недописанный файл.
+            with tempfile.NamedTemporaryFile(dir=self.data_dir, suffix='.tmp', delete=False) as file:
+                try:
+                    np.save(file, matrix, allow_pickle=False)
+                except BaseException:
+                    os.remove(file.name)
+                    raise
+            os.replace(file.name, path)
+        return os.path.getsize(path)
+
+    def _read(self, dataset_id: str):
+        path = self._path(dataset_id)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode='r', allow_pickle=False)
+
+    def _delete(self, dataset_id: str):
+        try:
+            os.remove(self._path(dataset_id))
+        except FileNotFoundError:
+            pass
+
+    def _read_header(self, dataset_id: str):
+        try:
+            with open(self._path(dataset_id), 'rb') as file:
+                return _parse_header(file)
+        except FileNotFoundError:
+            return None
+
+    def _extend(self, dataset_id: str, new_id: str, rows: np.ndarray):
+        path = self._path(dataset_id)
+        try:
+            with open(path, 'r+b') as file:
+                new_header = _extended_header(_parse_header(file), rows)
+                if new_header is None:
+                    return None
+                # Сначала данные, затем заголовок с новой формой: открытые memory map
+                # родительского набора продолжают видеть прежние строки.
+                file.seek(0, os.SEEK_END)
+                file.write(np.ascontiguousarray(rows).tobytes())
+                file.seek(0)
+                file.write(new_header)
+        except FileNotFoundError:
+            return None
+        os.replace(path, self._path(new_id))
+        return os.path.getsize(self._path(new_id))
+
+    def _path(self, dataset_id: str) -> str:
+        return os.path.join(self.data_dir, f'{dataset_id}.npy')
+
+
+# Заголовок .npy занимает 128 байт и дополнен пробелами, чтобы форма могла расти без сдвига данных.
+HEADER_READ_BYTES = 4096
+
+
+def _parse_header(stream):
+    try:
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    except ValueError:
+        return None
+    return shape, fortran_order, dtype, stream.tell()
+
+
+def _extended_header(header, rows: np.ndarray):
+    """
+    Получает заголовок .npy с формой, увеличенной на rows, той же длины, что и прежний.
+    :return: байты заголовка или None, если строки не подходят или заголовок не помещается.
+    """
+    if header is None:
+        return None
+    shape, fortran_order, dtype, length = header
+    if fortran_order or len(shape) != 2 or rows.dtype != dtype or rows.shape[1:] != shape[1:]:
+        return None
+
+    stream = io.BytesIO()
+    np.lib.format.write_array_header_1_0(stream, {
+        'descr': np.lib.format.dtype_to_descr(dtype),
+        'fortran_order': False,
+        'shape': (shape[0] + rows.shape[0],) + shape[1:],
+    })
+    new_header = stream.getvalue()
+    return new_header if len(new_header) == length else None
+
+
+_store: DatasetStore = None
+
+
+def get_store() -> DatasetStore:
+    global _store
+
+    if _store is None:
+        if DATASET_BACKEND == 'disk':
+            _store = DiskDatasetStore()
+        else:
+            _store = RedisDatasetStore()
+    return _store
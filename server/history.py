@@ -0,0 +1,184 @@
+import datetime
+import hashlib
+import json
+import uuid
+
+from typing import TYPE_CHECKING
+
+from server.redis_client import get_redis
+from server.meta_data import MetaData, Restriction
+from server.config import HISTORY_MAX_BYTES, HISTORY_MAX_ENTRIES
+
+if TYPE_CHECKING:
+    from server.lp import Result
+
+
+def settings_hash(meta_data: MetaData, restriction: Restriction) -> str:
+    """
+    Хэш настроек решения: набор данных, параметры и ограничения.
+    Одинаковые настройки дают одинаковый результат, поэтому решение можно взять из истории.
+    """
+    restriction_data = json.loads(json.dumps(restriction, cls=Restriction.DataEncoder))
+    settings = json.dumps([
+        meta_data.dataset_id,
+        meta_data.var_y,
+        meta_data.free_chlen,
+        meta_data.delta,
+        meta_data.solver,
+        meta_data.tau,
+        meta_data.weights_col,
+        restriction_data,
+    ], sort_keys=True)
+    return hashlib.sha1(settings.encode()).hexdigest()[:16]
+
+
+class ResultHistory:
+    """
+    Ограниченная история результатов сессии. Хранится в хэше сессии и истекает вместе с ним.
+    Поле history - оглавление: настройки и агрегаты (α, E, M, КСП) каждого запуска,
+    по нему строится сравнение без чтения самих результатов. Поля history:<id> -
+    результаты, где eps и yy хранятся как массивы в base64 (float64 или float32 -
+    в точности результата), а не списками JSON.
+    Самые старые записи вытесняются, когда история превышает HISTORY_MAX_BYTES
+    или HISTORY_MAX_ENTRIES.
+    """
+
+    INDEX_FIELD = 'history'
+
+    def __init__(self, token: str, expire_at: datetime.datetime):
+        """
+        :param token: токен сессии - ключ её хэша.
+        :param expire_at: время истечения сессии; восстанавливается, если хэш создан записью истории заново.
+        """
+        self.token = token
+        self.expire_at = expire_at
+        self._index = None
+
+    @property
+    def entries(self) -> list:
+        """
+        Записи оглавления от старых к новым.
+        """
+        if self._index is None:
+            _data = get_redis().hget(self.token, self.INDEX_FIELD)
+            self._index = json.loads(_data) if _data else []
+        return self._index
+
+    def find(self, settings: str):
+        for entry in reversed(self.entries):
+            if entry['settings'] == settings:
+                return entry
+        return None
+
+    def get(self, entry_id: str):
+        for entry in self.entries:
+            if entry['id'] == entry_id:
+                return entry
+        return None
+
+    def add(self, settings: str, meta_data: MetaData, restriction: Restriction, result: 'Result'):
+        """
+        Добавляет результат в историю. Запись с теми же настройками заменяется.
+        :return: запись оглавления или None, если результат больше всей истории.
+        """
+        entry_id = uuid.uuid4().hex[:12]
+        from server.precision import encode_array
+
+        blob = json.dumps({
+            'dtype': result.dtype,
+            'eps': encode_array(result.eps, result.dtype),
+            'yy': encode_array(result.yy, result.dtype),
+            'count_rows': result.count_rows,
+            'stats': result.stats,
+        })
+        entry = {
+            'id': entry_id,
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'settings': settings,
+            'var_y': meta_data.var_y,
+            'free_chlen': meta_data.free_chlen,
+            'delta': meta_data.delta,
+            'solver': meta_data.solver,
+            'tau': meta_data.tau,
+            'weights_col': meta_data.weights_col,
+            'rows': meta_data.rows,
+            'restrictions': restriction.get_count(),
+            'a': list(result.a),
+            'e': result.e,
+            'm': result.m,
+            'osp': result.osp,
+        }
+        entry['size'] = len(blob) + len(json.dumps(entry))
+        if entry['size'] > HISTORY_MAX_BYTES:
+            return None
+
+        evicted = [item for item in self.entries if item['settings'] == settings]
+        index = [item for item in self.entries if item['settings'] != settings] + [entry]
+        while len(index) > HISTORY_MAX_ENTRIES or sum(item['size'] for item in index) > HISTORY_MAX_BYTES:
+            evicted.append(index.pop(0))
+
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hset(self.token, self._field(entry_id), blob)
+        pipe.hset(self.token, self.INDEX_FIELD, json.dumps(index))
+        if evicted:
+            pipe.hdel(self.token, *[self._field(item['id']) for item in evicted])
+        pipe.ttl(self.token)
+        ttl = pipe.execute()[-1]
+
+        if ttl == -1:
+            # Хэш истёк между чтением и записью и создан заново без времени жизни (как в Session._save).
+            get_redis().expireat(self.token, self.expire_at)
+
+        self._index = index
+        return entry
+
+    def get_result(self, entry_id: str):
+        """
+        Восстанавливает результат из истории.
+        :return: результат или None, если записи нет.
+        """
+        from server.lp import Result
+        from server.precision import decode_array
+
+        entry = self.get(entry_id)
+        _data = get_redis().hget(self.token, self._field(entry_id)) if entry is not None else None
+        if not _data:
+            return None
+
+        blob = json.loads(_data)
+        dtype = blob.get('dtype', 'float64')
+        return Result.new_result({
+            'dtype': dtype,
+            'a': entry['a'],
+            'eps': decode_array(blob['eps'], dtype),
+            'yy': decode_array(blob['yy'], dtype),
+            'e': entry['e'],
+            'osp': entry['osp'],
+            'count_rows': blob['count_rows'],
+            'stats': blob['stats'],
+        })
+
+    def compare(self, base_id: str) -> list:
+        """
+        Сравнивает все записи с базовой: разности α, E, M и КСП.
+        :param base_id: идентификатор базовой записи; по умолчанию последняя.
+        :return: записи оглавления с полем diff (None для базовой и несравнимых α).
+        """
+        base = self.get(base_id) or (self.entries[-1] if self.entries else None)
+        rows = []
+        for entry in self.entries:
+            row = dict(entry)
+            row['base'] = base is not None and entry['id'] == base['id']
+            row['diff'] = None if row['base'] else {
+                'a': [value - base_value for value, base_value in zip(entry['a'], base['a'])]
+                if len(entry['a']) == len(base['a']) else None,
+                'e': entry['e'] - base['e'],
+                'm': entry['m'] - base['m'],
+                'osp': entry['osp'] - base['osp'],
+            }
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def _field(entry_id: str) -> str:
+        return f'history:{entry_id}'
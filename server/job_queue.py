@@ -0,0 +1,221 @@
+import json
+import logging
+import threading
+import time
+import uuid
+
+from typing import TYPE_CHECKING
+
+from server import metrics
+from server.redis_client import get_redis
+from server.meta_data import MetaData, Restriction
+from server.solver import SolverBusy, SolveFailed, SolveLimitExceeded, run_limited, solve
+from server.config import QUEUE_VISIBILITY_TIMEOUT, QUEUE_MAX_ATTEMPTS, QUEUE_MAX_LENGTH, QUEUE_WAIT_TIMEOUT, \
+    QUEUE_RESULT_TTL
+
+if TYPE_CHECKING:
+    from server.lp import Result
+
+QUEUE_KEY = 'solve:queue'
+PROCESSING_KEY = 'solve:processing'
+
+logger = logging.getLogger(__name__)
+
+
+def submit(meta_data: MetaData, restriction: Restriction) -> 'Result':
+    """
+    Ставит задачу в очередь и ожидает, пока её решит один из воркеров.
+    :raises SolverBusy: очередь заполнена или результат не получен за QUEUE_WAIT_TIMEOUT.
+    :raises SolveFailed: задача не решена за QUEUE_MAX_ATTEMPTS попыток.
+    """
+
+    return wait(enqueue(meta_data, restriction))
+
+
+def enqueue(meta_data: MetaData, restriction: Restriction) -> str:
+    """
+    Ставит задачу в очередь. В задаче хранятся метаданные (с идентификатором
+    набора данных, сама матрица читается воркером из хранилища) и ограничения.
+    :return: идентификатор задачи.
+    """
+
+    r = get_redis()
+    if r.llen(QUEUE_KEY) >= QUEUE_MAX_LENGTH:
+        metrics.SOLVE_REJECTED.inc()
+        raise SolverBusy()
+
+    job_id = uuid.uuid4().hex
+    pipe = r.pipeline(transaction=False)
+    pipe.hset(_job_key(job_id), mapping={
+        'meta_data': json.dumps(meta_data, cls=MetaData.DataEncoder),
+        'restriction': json.dumps(restriction, cls=Restriction.DataEncoder),
+        'submitted': time.time(),
+        'attempts': 0,
+        'status': 'queued',
+    })
+    pipe.expire(_job_key(job_id), QUEUE_WAIT_TIMEOUT + QUEUE_RESULT_TTL)
+    pipe.lpush(QUEUE_KEY, job_id)
+    pipe.execute()
+    return job_id
+
+
+def wait(job_id: str, timeout: int = QUEUE_WAIT_TIMEOUT) -> 'Result':
+    """
+    Ожидает завершения задачи без опроса: воркер кладёт отметку в список задачи.
+    Если задача не решена за timeout, она отменяется: удаляется из очереди, а воркер,
+    уже забравший её, пропускает её или решает впустую.
+    :raises SolverBusy: результат не получен за timeout.
+    """
+    from server.lp import Result
+
+    r = get_redis()
+    if r.blpop(_done_key(job_id), timeout) is None:
+        pipe = r.pipeline(transaction=False)
+        # Отметка хранится отдельным полем: возврат задачи в очередь перезаписывает status.
+        pipe.hset(_job_key(job_id), 'cancelled', 1)
+        pipe.expire(_job_key(job_id), QUEUE_RESULT_TTL)
+        pipe.lrem(QUEUE_KEY, 1, job_id)
+        pipe.execute()
+        raise SolverBusy()
+
+    status, result, error = r.hmget(_job_key(job_id), ['status', 'result', 'error'])
+    if status == 'limit_exceeded':
+        raise SolveLimitExceeded(error)
+    if status != 'done':
+        raise SolveFailed(error)
+    return Result.new_result(json.loads(result))
+
+
+class Worker:
+    """
+    Воркер решателя. Забирает задачи из очереди в список обрабатываемых
+    (BRPOPLPUSH) и отмечает в задаче срок, до которого должен её решить.
+    Пока задача решается, срок продлевается. Задачи с истёкшим сроком (воркер
+    завис или остановлен) возвращаются в очередь любым воркером; после
+    QUEUE_MAX_ATTEMPTS неудачных попыток задача завершается с ошибкой.
+    """
+
+    def __init__(self, poll_timeout: int = 5):
+        self.poll_timeout = poll_timeout
+        self._stopped = threading.Event()
+
+    def run(self):
+        from server import lp  # noqa: F401
+
+        logger.info('Worker started')
+        r = get_redis()
+        while not self._stopped.is_set():
+            self.requeue_expired()
+            job_id = r.brpoplpush(QUEUE_KEY, PROCESSING_KEY, self.poll_timeout)
+            if job_id is not None:
+                self.process(job_id)
+        logger.info('Worker stopped')
+
+    def stop(self):
+        """
+        Останавливает воркер после завершения текущей задачи.
+        """
+        self._stopped.set()
+
+    def process(self, job_id: str):
+        r = get_redis()
+        pipe = r.pipeline(transaction=False)
+        pipe.exists(_job_key(job_id))
+        pipe.hget(_job_key(job_id), 'cancelled')
+        pipe.hincrby(_job_key(job_id), 'attempts', 1)
+        pipe.hset(_job_key(job_id), mapping={'status': 'running', 'deadline': time.time() + QUEUE_VISIBILITY_TIMEOUT})
+        pipe.hmget(_job_key(job_id), ['meta_data', 'restriction', 'submitted'])
+        exists, cancelled, attempts, _, (meta_data, restriction, submitted) = pipe.execute()
+
+        if not exists or cancelled:
+            # Задача истекла или отменена, пока ждала в очереди: её результат уже никто не ждёт.
+            r.delete(_job_key(job_id))
+            r.lrem(PROCESSING_KEY, 1, job_id)
+            return
+
+        heartbeat = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, heartbeat), daemon=True).start()
+        try:
+            result = run_limited(solve, MetaData(json.loads(meta_data)), Restriction(data=json.loads(restriction)),
+                                 float(submitted))
+        except SolveLimitExceeded as e:
+            # Повторная попытка превысит ограничение снова: задача завершается сразу.
+            logger.warning('Job %s exceeded limits: %s', job_id, e)
+            if r.lrem(PROCESSING_KEY, 1, job_id):
+                pipe = r.pipeline(transaction=False)
+                pipe.hset(_job_key(job_id), mapping={'status': 'limit_exceeded', 'error': str(e)})
+                pipe.expire(_job_key(job_id), QUEUE_RESULT_TTL)
+                self._notify(pipe, job_id)
+                pipe.execute()
+            return
+        except Exception as e:
+            logger.exception('Job %s failed, attempt %s', job_id, attempts)
+            if r.lrem(PROCESSING_KEY, 1, job_id):
+                self._retry_or_fail(job_id, attempts, repr(e))
+            return
+        finally:
+            heartbeat.set()
+
+        from server.lp import Result
+
+        pipe = r.pipeline(transaction=False)
+        pipe.hset(_job_key(job_id), mapping={'status': 'done', 'result': json.dumps(result, cls=Result.DataEncoder)})
+        pipe.expire(_job_key(job_id), QUEUE_RESULT_TTL)
+        pipe.lrem(PROCESSING_KEY, 1, job_id)
+        self._notify(pipe, job_id)
+        pipe.execute()
+
+    def requeue_expired(self):
+        """
+        Возвращает в очередь задачи, срок обработки которых истёк.
+        Задачу возвращает тот воркер, которому удалось удалить её из списка обрабатываемых.
+        """
+        r = get_redis()
+        job_ids = r.lrange(PROCESSING_KEY, 0, -1)
+        if not job_ids:
+            return
+
+        pipe = r.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hmget(_job_key(job_id), ['deadline', 'attempts'])
+        now = time.time()
+        for job_id, (deadline, attempts) in zip(job_ids, pipe.execute()):
+            # Без срока задача либо только что взята (срок ещё не записан), либо уже истекла.
+            if deadline is None:
+                if attempts is None:
+                    r.lrem(PROCESSING_KEY, 1, job_id)
+                continue
+            if float(deadline) < now and r.lrem(PROCESSING_KEY, 1, job_id):
+                logger.warning('Job %s visibility timeout expired', job_id)
+                self._retry_or_fail(job_id, int(attempts), 'visibility timeout expired')
+
+    def _retry_or_fail(self, job_id: str, attempts: int, error: str):
+        r = get_redis()
+        pipe = r.pipeline(transaction=False)
+        if attempts < QUEUE_MAX_ATTEMPTS:
+            pipe.hset(_job_key(job_id), mapping={'status': 'queued', 'error': error})
+            pipe.hdel(_job_key(job_id), 'deadline')
+            pipe.lpush(QUEUE_KEY, job_id)
+        else:
+            pipe.hset(_job_key(job_id), mapping={'status': 'failed', 'error': error})
+            pipe.expire(_job_key(job_id), QUEUE_RESULT_TTL)
+            self._notify(pipe, job_id)
+        pipe.execute()
+
+    def _heartbeat(self, job_id: str, stopped: threading.Event):
+        r = get_redis()
+        while not stopped.wait(QUEUE_VISIBILITY_TIMEOUT / 3):
+            r.hset(_job_key(job_id), 'deadline', time.time() + QUEUE_VISIBILITY_TIMEOUT)
+
+    @staticmethod
+    def _notify(pipe, job_id: str):
+        pipe.lpush(_done_key(job_id), 1)
+        pipe.expire(_done_key(job_id), QUEUE_RESULT_TTL)
+
+
+def _job_key(job_id: str) -> str:
+    return f'solve:job:{job_id}'
+
+
+def _done_key(job_id: str) -> str:
+    return f'solve:job:{job_id}:done'
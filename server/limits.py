@@ -0,0 +1,185 @@
+import math
+import signal
+import threading
+import time
+
+from contextlib import contextmanager
+
+from server.config import SOLVE_MEMORY_LIMIT, SOLVE_CPU_LIMIT, FAST_SOLVE_ROWS_FACTOR
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Память модели на элемент матрицы ограничений и на переменную: объекты pulp
+# в процессе решателя вместе с CBC (замерено на pulp 2.x и CBC 2.10).
+BYTES_PER_NONZERO = 650
+BYTES_PER_VARIABLE = 1300
+
+
+class SolveLimitExceeded(Exception):
+    """
+    Решение превысило ограничение памяти или процессорного времени,
+    либо модель по прогнозу не помещается в SOLVE_MEMORY_LIMIT.
+    """
+
+
+def predict_model_bytes(n: int, p: int, restrictions: int = 0, fast: bool = False) -> int:
+    """
+    Прогнозирует память на построение и решение модели.
+    :param n: количество наблюдений.
+    :param p: количество коэффициентов α (регрессоры и свободный член).
+    :param restrictions: количество ненулевых элементов ограничений.
+    :param fast: быстрый решатель - точно решается только часть наблюдений.
+    """
+    rows = n
+    if fast:
+        rows = min(n, max(int(FAST_SOLVE_ROWS_FACTOR * p * math.sqrt(n)), 10 * p))
+
+    nonzeros = rows * (2 * p + 2) + 2 * restrictions
+    variables = 2 * rows + 2 * p
+    # Плотные копии x, y, весов и остатков в numpy.
+    arrays = 8 * n * (p + 4) * (3 if fast else 1)
+    return BYTES_PER_NONZERO * nonzeros + BYTES_PER_VARIABLE * variables + arrays
+
+
+def check_model_size(n: int, p: int, restrictions: int = 0, fast: bool = False):
+    """
+    Отклоняет задачу, модель которой по прогнозу не помещается в SOLVE_MEMORY_LIMIT.
+    :raises SolveLimitExceeded: прогноз превышает ограничение.
+    """
+    if not SOLVE_MEMORY_LIMIT:
+        return
+
+    predicted = predict_model_bytes(n, p, restrictions, fast)
+    if predicted > SOLVE_MEMORY_LIMIT:
+        raise SolveLimitExceeded(
+            f'Модель для {n} наблюдений и {p} коэффициентов потребует около {_format_bytes(predicted)} памяти, '
+            f'ограничение - {_format_bytes(SOLVE_MEMORY_LIMIT)}.')
+
+
+@contextmanager
+def limited(reserved: int = 0):
+    """
+    Выполняет блок с ограничениями SOLVE_MEMORY_LIMIT и SOLVE_CPU_LIMIT. Ограничения
+    задаются мягкими rlimit процесса относительно текущего потребления и снимаются
+    после блока. Устанавливаются только в главном потоке процесса решателя:
+    в веб-процессе они ограничили бы все запросы.
+    Запускаемый CBC наследует те же значения rlimit, но отсчитывает их от нуля:
+    его адресное пространство ограничено адресным пространством родителя плюс
+    SOLVE_MEMORY_LIMIT, процессорное время - временем родителя плюс SOLVE_CPU_LIMIT.
+    Точно время CBC ограничивает его параметр timeLimit (см. LpSolve).
+    :param reserved: байты, уже занятые процессом сверх базового потребления (кэш
+                     моделей); вычитаются из SOLVE_MEMORY_LIMIT.
+    :raises SolveLimitExceeded: превышено ограничение памяти или времени.
+    """
+    if resource is None or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    _warm_up_blas()
+    memory = resource.getrlimit(resource.RLIMIT_AS)
+    cpu = resource.getrlimit(resource.RLIMIT_CPU)
+    handler = signal.getsignal(signal.SIGXCPU)
+    try:
+        if SOLVE_MEMORY_LIMIT:
+            budget = max(SOLVE_MEMORY_LIMIT - reserved, 0)
+            resource.setrlimit(resource.RLIMIT_AS, (_soft_limit(_address_space() + budget, memory[1]), memory[1]))
+        if SOLVE_CPU_LIMIT:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = math.ceil(usage.ru_utime + usage.ru_stime)
+            signal.signal(signal.SIGXCPU, _cpu_exceeded)
+            resource.setrlimit(resource.RLIMIT_CPU, (_soft_limit(used + SOLVE_CPU_LIMIT, cpu[1]), cpu[1]))
+        yield
+    except MemoryError:
+        raise SolveLimitExceeded(f'Решение превысило ограничение памяти {_format_bytes(SOLVE_MEMORY_LIMIT)}.')
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, cpu)
+        resource.setrlimit(resource.RLIMIT_AS, memory)
+        signal.signal(signal.SIGXCPU, handler)
+
+
+@contextmanager
+def accounted(stats: dict):
+    """
+    Записывает в stats время выполнения блока (wall_time, с) и пиковую память
+    процесса (peak_rss, байты). Пик сбрасывается перед блоком, если ядро это
+    позволяет (Linux), иначе это пик за время жизни процесса. Память CBC не
+    записывается: ядро хранит только пик дочерних процессов за всё время жизни.
+    """
+    _reset_peak_rss()
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats['wall_time'] = time.perf_counter() - start
+        stats['peak_rss'] = _peak_rss()
+
+
+_blas_ready = False
+
+
+def _warm_up_blas():
+    """
+    OpenBLAS выделяет буферы потоков при первом вызове и при нехватке памяти
+    завершает процесс аварийно, а не выбрасывает MemoryError. Поэтому буферы
+    выделяются до установки ограничения памяти.
+    """
+    global _blas_ready
+
+    if not _blas_ready:
+        import numpy as np
+
+        np.linalg.lstsq(np.eye(64), np.ones(64), rcond=None)
+        _blas_ready = True
+
+
+def _cpu_exceeded(signum, frame):
+    # Сигнал повторяется каждую секунду до жёсткого ограничения: снимаем мягкое сразу.
+    resource.setrlimit(resource.RLIMIT_CPU, (resource.RLIM_INFINITY, resource.getrlimit(resource.RLIMIT_CPU)[1]))
+    raise SolveLimitExceeded(f'Решение превысило ограничение процессорного времени {SOLVE_CPU_LIMIT} с.')
+
+
+def _soft_limit(value: int, hard: int) -> int:
+    return value if hard == resource.RLIM_INFINITY else min(value, hard)
+
+
+def _address_space() -> int:
+    return _read_status('VmSize') or 0
+
+
+def _reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss() -> int:
+    peak = _read_status('VmHWM')
+    if peak is None and resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak
+
+
+def _read_status(field: str):
+    """
+    Читает размер из /proc/self/status в байтах или None, если он недоступен.
+    """
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _format_bytes(value: int) -> str:
+    for unit in ('Б', 'КБ', 'МБ', 'ГБ'):
+        if value < 1024 or unit == 'ГБ':
+            return f'{value:.0f} {unit}' if unit == 'Б' else f'{value:.1f} {unit}'
+        value /= 1024
@@ -0,0 +1,185 @@
+import io
+
+import numpy as np
+
+from server.precision import storage_dtype
+
+NPY_MAGIC = b'\x93NUMPY'
+PARQUET_MAGIC = b'PAR1'
+ARROW_MAGIC = b'ARROW1'
+FEATHER_V1_MAGIC = b'FEA1'
+
+
+def load_matrix(content: bytes, dtype: np.dtype = None) -> np.ndarray:
+    """
+    Разбирает загруженный файл с исходными данными. Формат определяется
+    по содержимому, а не по расширению: .npy, Parquet, Arrow/Feather
+    (при установленном pyarrow), CSV или текст с разделителями-пробелами.
+    :param content: содержимое файла.
+    :param dtype: тип матрицы (float64 или float32); по умолчанию MATRIX_PRECISION.
+    :return: матрица размера (строки, столбцы).
+    :raises ValueError: файл не удалось разобрать.
+    """
+
+    dtype = dtype or storage_dtype()
+    if content.startswith(NPY_MAGIC):
+        matrix = parse_npy(content, dtype)
+    elif content.startswith(PARQUET_MAGIC) or content.startswith(ARROW_MAGIC) \
+            or content.startswith(FEATHER_V1_MAGIC):
+        matrix = parse_arrow(content, dtype)
+    else:
+        matrix = parse_text(content, dtype)
+
+    if matrix.ndim != 2 or matrix.size == 0:
+        raise ValueError('Матрица должна быть двумерной и непустой.')
+    return matrix
+
+
+def parse_npy(content: bytes, dtype: np.dtype = np.float64) -> np.ndarray:
+    """
+    Читает .npy без копирования, если тип файла совпадает с dtype:
+    тогда массив - это представление поверх байтов загрузки.
+    Целые числа приводятся к dtype, остальные типы (строки, bool, комплексные) не принимаются.
+    """
+
+    stream = io.BytesIO(content)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, file_dtype = np.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, file_dtype = np.lib.format.read_array_header_2_0(stream)
+
+    if file_dtype.kind not in 'iuf':
+        raise ValueError('Файл содержит нечисловые значения.')
+
+    count = int(np.prod(shape))
+    matrix = np.frombuffer(content, dtype=file_dtype, count=count, offset=stream.tell())
+    matrix = matrix.reshape(shape, order='F' if fortran_order else 'C')
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(-1, 1)
+    return np.ascontiguousarray(matrix, dtype=dtype)
+
+
+def parse_arrow(content: bytes, dtype: np.dtype = np.float64) -> np.ndarray:
+    """
+    Читает Parquet или Arrow/Feather. Требует установленный pyarrow.
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError('Для загрузки Parquet и Arrow/Feather необходим пакет pyarrow.')
+
+    buffer = pyarrow.BufferReader(content)
+    if content.startswith(PARQUET_MAGIC):
+        table = pyarrow.parquet.read_table(buffer)
+    else:
+        table = pyarrow.feather.read_table(buffer)
+
+    return np.column_stack([column.to_numpy().astype(dtype) for column in table.columns])
+
+
+def parse_text(content: bytes, dtype: np.dtype = np.float64) -> np.ndarray:
+    """
+    Разбирает текстовый файл: каждая строка - строка матрицы, значения разделены
+    пробелами, табуляцией, запятой или точкой с запятой (CSV). Первая строка
+    пропускается, если это заголовок с нечисловыми значениями. Числа разбираются
+    в numpy сразу в dtype, без создания объектов float для каждого значения.
+    """
+
+    text = content.decode('utf-8-sig')
+    lines = text.lstrip().split('\n', 1)
+    first = lines[0]
+
+    if ';' in first:
+        # Точка с запятой - разделитель, запятая - десятичный разделитель.
+        text = text.replace(',', '.').replace(';', ' ')
+    elif ',' in first:
+        text = text.replace(',', ' ')
+    first = text.lstrip().split('\n', 1)[0]
+
+    if not _is_numeric(first.split()):
+        text = text.lstrip().split('\n', 1)[1] if '\n' in text.lstrip() else ''
+        first = text.lstrip().split('\n', 1)[0]
+
+    cols = len(first.split())
+    if cols == 0:
+        raise ValueError('Файл не содержит данных.')
+
+    # На нечисловом значении numpy либо выбрасывает ValueError, либо (в старых версиях)
+    # предупреждает и останавливает разбор - тогда файл не пройдёт проверку количества
+    # чисел. Фильтр предупреждений не меняется: он общий для всех потоков сервера.
+    try:
+        values = np.fromstring(text, dtype=dtype, sep=' ')
+    except ValueError:
+        raise ValueError('Файл содержит нечисловые значения.')
+    # Количество чисел проверяется в каждой строке: при совпадении только общего
+    # количества значения строк разной длины сдвинулись бы в соседние строки.
+    lengths = _row_lengths(text)
+    if (lengths != cols).any() or values.size != lengths.size * cols:
+        raise ValueError('Файл содержит нечисловые значения или строки с разным количеством чисел.')
+
+    return values.reshape(lengths.size, cols)
+
+
+def _is_numeric(tokens: list) -> bool:
+    try:
+        for token in tokens:
+            float(token)
+    except ValueError:
+        return False
+    return True
+
+
+def _row_lengths(text: str) -> np.ndarray:
+    """
+    Получает количество значений в каждой непустой строке текста, не разбивая
+    его на строки и значения Python: значение начинается там, где после пробельного
+    символа идёт непробельный. Пробельными считаются пробел и управляющие символы.
+    """
+    chars = np.frombuffer(text.encode(), dtype=np.uint8)
+    blank = chars <= ord(' ')
+    starts = np.flatnonzero(blank[:-1] & ~blank[1:]) + 1
+    if chars.size and not blank[0]:
+        starts = np.concatenate([[0], starts])
+
+    lines = np.searchsorted(np.flatnonzero(chars == ord('\n')), starts)
+    lengths = np.bincount(lines)
+    return lengths[lengths > 0]
+
+
+RESTRICTION_OPERATORS = {'=': 'EQUALS', '==': 'EQUALS', '>=': 'MORE_OR_EQUAL', '<=': 'LESS_OR_EQUAL'}
+
+
+def load_restrictions(content: bytes) -> (list, list, list):
+    """
+    Разбирает файл с ограничениями в разреженной записи: одна строка - одно
+    ограничение вида «столбец:значение ... оператор b», например «0:1 2:-1 <= 10».
+    Столбец - номер коэффициента α (начинается с 0), оператор - =, >= или <=.
+    Пустые строки и строки, начинающиеся с #, пропускаются.
+    :param content: содержимое файла.
+    :return: элементы (строка, столбец, значение), операторы и правые части.
+    :raises ValueError: строку не удалось разобрать.
+    """
+
+    entries, operators, b = [], [], []
+    for number, line in enumerate(content.decode('utf-8-sig').splitlines(), 1):
+        tokens = line.split()
+        if not tokens or tokens[0].startswith('#'):
+            continue
+        if len(tokens) < 2 or tokens[-2] not in RESTRICTION_OPERATORS:
+            raise ValueError(f'Строка {number}: ожидается «столбец:значение ... оператор b».')
+
+        row = len(b)
+        try:
+            for token in tokens[:-2]:
+                col, value = token.split(':')
+                entries.append((row, int(col), float(value)))
+            b.append(float(tokens[-1]))
+        except ValueError:
+            raise ValueError(f'Строка {number}: ожидается «столбец:значение ... оператор b».')
+        operators.append(RESTRICTION_OPERATORS[tokens[-2]])
+
+    return entries, operators, b
@@ -1,80 +1,100 @@
 import json
-import math
+import time
 
 import numpy as np
 import pulp
 
-from functools import reduce
-
+from server.limits import SolveLimitExceeded, check_model_size
 from server.meta_data import MetaData, Restriction, OperatorEnum
+from server.config import FAST_SOLVE_ROWS_FACTOR, FAST_SOLVE_ROUNDS, SOLVE_CPU_LIMIT
+from server.precision import decode_array, encode_array, result_dtype
 
 
 class Data:
     """
     Класс для промежуточной подготовки исходных данных.
+    Граница решателя: x, y и веса всегда float64, даже если матрица хранится в float32.
     """
 
     x: np.ndarray
     y: np.ndarray
+    weights: np.ndarray  # Веса наблюдений, по умолчанию 1.
+    dtype: np.dtype  # Тип ошибок и расчётных значений результата: float32 для матриц float32.
     r: float
     delta: float
-    omega: np.ndarray
+    tau: float
     restriction: Restriction
+    solver: str
 
     def __init__(self, meta_data: MetaData, restriction: Restriction):
         self.restriction = restriction
         self.delta = meta_data.delta
+        self.tau = meta_data.tau
+        self.solver = meta_data.solver
+        self._omega = None
+        self.dtype = result_dtype(meta_data.load_data)
         self._set_y(meta_data)
         self._set_x(meta_data)
-        self._calculation_omega()
+        self._set_weights(meta_data)
+
+    def get_costs(self) -> (np.ndarray, np.ndarray):
+        """
+        Получает стоимости положительной (u) и отрицательной (v) ошибки наблюдений:
+        2τw и 2(1 - τ)w. При τ = 0.5 и единичных весах это МНМ.
+        Вес w равносилен повторению наблюдения w раз.
+        """
+        return 2 * self.tau * self.weights, 2 * (1 - self.tau) * self.weights
+
+    def subset(self, rows: np.ndarray) -> 'Data':
+        """
+        Получает данные только по части наблюдений с теми же ограничениями и δ.
+        :param rows: индексы наблюдений.
+        """
+        data = Data.__new__(Data)
+        data.restriction = self.restriction
+        data.delta = self.delta
+        data.tau = self.tau
+        data.solver = self.solver
+        data._omega = None
+        data.dtype = self.dtype
+        data.x = self.x[rows]
+        data.y = self.y[rows]
+        data.weights = self.weights[rows]
+        return data
 
     def _set_x(self, meta_data: MetaData):
-        x = []
-        for array in meta_data.load_data:
-            index = 0
-            arr = []
-            for item in array:
-                if index != meta_data.var_y - 1:
-                    arr.append(item)
-                index += 1
-            x.append(arr)
+        # Матрица может быть memory map: срезы читают файл последовательно,
+        # без создания объектов float для каждого элемента.
+        load_data = meta_data.load_data
+        x = np.asarray(load_data[:, meta_data.get_regressor_cols()], dtype=np.float64)
 
         if meta_data.free_chlen:
-            _x = []
-            for items in x:
-                line = [1]
-                line.extend(items)
-                _x.append(line)
-            x = _x
+            x = np.column_stack([np.ones(x.shape[0]), x])
 
-        self.x = np.array(x)
+        self.x = x
 
     def _set_y(self, meta_data: MetaData):
-        y = []
-        for array in meta_data.load_data:
-            index = 0
-            for item in array:
-                if index == meta_data.var_y - 1:
-                    y.append(item)
-                index += 1
+        self.y = np.array(meta_data.load_data[:, meta_data.var_y - 1], dtype=np.float64)
 
-        self.y = np.array(y)
+    def _set_weights(self, meta_data: MetaData):
+        if not meta_data.weights_col:
+            self.weights = np.ones(self.y.size)
+            return
 
-    def _calculation_omega(self):
-        omega = []
+        self.weights = np.array(meta_data.load_data[:, meta_data.weights_col - 1], dtype=np.float64)
+        if (self.weights < 0).any():
+            raise ValueError('Веса наблюдений должны быть неотрицательными.')
 
-        n = self.y.size
-        for k in range(n - 1):
-            for s in range(k + 1, n):
-                exp = self.y[k] - self.y[s]
-                if exp > 0:
-                    omega.append(1)
-                elif exp < 0:
-                    omega.append(-1)
-                else:  # == 0
-                    omega.append(0)
-
-        self.omega = np.array(omega)
+    @property
+    def omega(self) -> np.ndarray:
+        """
+        Знаки попарных разностей y[k] - y[s] для k < s.
+        Вычисляется только при обращении: размер массива растёт как n^2.
+        """
+        if self._omega is None:
+            k, s = np.triu_indices(self.y.size, 1)
+            self._omega = np.sign(self.y[k] - self.y[s]).astype(int)
+        return self._omega
 
 
 class Result:
@@ -86,22 +106,28 @@ class Result:
     osp: float
     count_rows: int
     N: float
+    stats: dict  # Время этапов, размер задачи и статус решателя.
+    dtype: str  # Точность eps и yy: float64 или float32 (для матриц float32).
 
     def __init__(self):
         self.a = []
         self.eps = []
         self.yy = []
+        self.stats = {}
+        self.dtype = 'float64'
 
     @staticmethod
     def new_result(data=None):
         result = Result()
         if data is not None:
+            result.dtype = Result.get_value(data, 'dtype') or 'float64'
             result.a = Result.get_value(data, 'a')
-            result.eps = Result.get_value(data, 'eps')
-            result.yy = Result.get_value(data, 'yy')
+            result.eps = Result._decode(Result.get_value(data, 'eps'), result.dtype)
+            result.yy = Result._decode(Result.get_value(data, 'yy'), result.dtype)
             result.e = Result.get_value(data, 'e')
             result.osp = Result.get_value(data, 'osp')
             result.count_rows = Result.get_value(data, 'count_rows')
+            result.stats = Result.get_value(data, 'stats') or {}
 
         return result
 
@@ -117,16 +143,17 @@ class Result:
         """
         Получает сумму модулей ошибок.
         """
-        m = 0
-        for item in self.eps:
-            m += abs(item)
+        return float(np.abs(np.asarray(self.eps, dtype=np.float64)).sum())
 
-        return m
-
-    def calculation(self, _x: np.ndarray, _y: np.ndarray):
+    def calculation(self, _x: np.ndarray, _y: np.ndarray, dtype: np.dtype = np.float64):
         """
         Шаблонный метод для вычисления агрегированных результатов вычислений.
+        :param dtype: точность ошибок, расчётных значений и поэлементных вычислений
+                      показателей; суммы и средние накапливаются в float64.
         """
+        self.dtype = np.dtype(dtype).name
+        if self.dtype != 'float64':
+            self.eps = np.asarray(self.eps, dtype=self.dtype).tolist()
         self._set_yy(_x)
         self._epsilon_e(_y)
         self._set_max_rows()
@@ -134,28 +161,53 @@ class Result:
 
     def _set_osp(self, y: np.ndarray):
         """
-        Обобщенный критерий согласованности поведения.
+        Обобщенный критерий согласованности поведения: количество пар наблюдений i < j,
+        для которых (yy[i] - yy[j]) * (y[i] - y[j]) > 0. Считается за O(n log n) без перебора пар.
         """
-        a = []
-        for i in range(len(y) - 1):
-            for j in range(i + 1, len(y)):
-                a.append(self._sign((self.yy[i] - self.yy[j]) * (y[i] - y[j])))
+        y = np.asarray(y, dtype=self.dtype)
+        yy = np.asarray(self.yy, dtype=self.dtype)
+        if y.size < 2:
+            self.osp = 0
+            return
+
+        # В порядке возрастания (y, yy) согласованы пары с ростом yy, кроме пар с равными y.
+        order = np.lexsort((yy, y))
+        _, ranks = np.unique(yy, return_inverse=True)
+        increasing = _count_increasing_pairs(ranks[order])
+
+        _, y_counts = np.unique(y, return_counts=True)
+        _, pair_counts = np.unique(np.column_stack([y, yy]), axis=0, return_counts=True)
+        equal_y = int((y_counts * (y_counts - 1) // 2).sum()) - int((pair_counts * (pair_counts - 1) // 2).sum())
 
-        self.osp = sum(a)
+        self.osp = increasing - equal_y
 
     def _set_yy(self, _x: np.ndarray):
-        self.yy = list(map(lambda item: sum(list(map(lambda x, a: x * a, item, self.a))), _x))
+        self.yy = (_x @ np.asarray(self.a, dtype=np.float64)).astype(self.dtype).tolist()
 
     def _epsilon_e(self, _y: np.ndarray):
         """
         Расчёт оценки ошибки аппроксимации.
         """
-        self.e = 1 / len(_y) * reduce(
-            lambda x, y: x + y, list(map(lambda x, y: math.fabs((y - x) / y), self.yy, _y))) * 100
+        _y = np.asarray(_y, dtype=self.dtype)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.e = float(np.abs((_y - np.asarray(self.yy, dtype=self.dtype)) / _y).mean(dtype=np.float64) * 100)
 
     def _set_max_rows(self):
         self.count_rows = max(len(self.a), len(self.yy), len(self.eps))
 
+    def summary(self) -> dict:
+        """
+        Получает коэффициенты и агрегированные показатели без ошибок по наблюдениям.
+        """
+        return {
+            'a': list(self.a),
+            'e': self.e,
+            'm': self.m,
+            'osp': int(self.osp),
+            'status': self.stats.get('status'),
+            'stats': self.stats,
+        }
+
     def get_max_rows(self):
         return list(map(int, range(self.count_rows)))
 
@@ -197,13 +249,76 @@ class Result:
     def _sign(x) -> int:
         return 1 if x > 0 else 0
 
+    @staticmethod
+    def _decode(values, dtype: str):
+        return decode_array(values, dtype) if isinstance(values, str) else values
+
     class DataEncoder(json.JSONEncoder):
         """
-        Класс кодирует модель MetaData в JSON формат.
+        Класс кодирует модель MetaData в JSON формат. Ошибки и расчётные значения
+        результата float32 кодируются байтами в base64: это в несколько раз короче списков JSON.
         """
 
         def default(self, obj):
             if isinstance(obj, Result):
+                if obj.dtype == 'float64':
+                    return obj.__dict__
+                data = dict(obj.__dict__)
+                data['eps'] = encode_array(obj.eps, obj.dtype)
+                data['yy'] = encode_array(obj.yy, obj.dtype)
+                return data
+            return json.JSONEncoder.default(self, obj)
+
+
+class MultiResult:
+    """
+    Результаты моделей, в которых откликом по очереди выступает каждый из выбранных столбцов.
+    """
+
+    responses: list  # Номера столбцов-откликов. Начинаются с 1.
+    columns: list  # Заголовки матрицы коэффициентов: 0 - свободный член, далее номера столбцов без весов.
+    a: list  # Матрица коэффициентов: строка на отклик, None в столбце самого отклика.
+    e: list
+    m: list
+    osp: list
+    status: list
+
+    def __init__(self, cols: int, free_chlen: bool, weights_col: int = None):
+        self.free_chlen = free_chlen
+        self.columns = ([0] if free_chlen else []) + [col for col in range(1, cols + 1) if col != weights_col]
+        self.responses = []
+        self.a = []
+        self.e = []
+        self.m = []
+        self.osp = []
+        self.status = []
+
+    def add(self, response: int, summary: dict):
+        """
+        Добавляет результат модели с откликом в столбце response.
+        :param summary: α, E, M, КСП и статус модели (см. Result.summary).
+        """
+        a = list(summary['a'])
+        # Коэффициенты идут в порядке столбцов без отклика: ставим None на его место.
+        a.insert(self.columns.index(response), None)
+
+        self.responses.append(response)
+        self.a.append(a)
+        self.e.append(summary['e'])
+        self.m.append(summary['m'])
+        self.osp.append(summary['osp'])
+        self.status.append(summary['status'])
+
+    def get_rows(self) -> list:
+        return list(zip(self.responses, self.a, self.e, self.m, self.osp, self.status))
+
+    class DataEncoder(json.JSONEncoder):
+        """
+        Класс кодирует модель MultiResult в JSON формат.
+        """
+
+        def default(self, obj):
+            if isinstance(obj, MultiResult):
                 return obj.__dict__
             return json.JSONEncoder.default(self, obj)
 
@@ -217,22 +332,135 @@ class LpSolve:
     result: Result
     _vars: dict
     _problem: pulp.LpProblem
+    _warm_start: bool
 
-    def __init__(self, data: Data):
+    def __init__(self, data: Data, execute: bool = True):
+        """
+        :param data: подготовленные исходные данные.
+        :param execute: если False, то модель только строится, а решение
+                        запускается отдельно методами execute и calculation.
+        """
         self.data = data
         self.result = Result()
         self._vars = {}
         self._problem = pulp.LpProblem('0', pulp.const.LpMinimize)
+        self._warm_start = False
+
+        start = time.perf_counter()
         self._create_variable_u_v()
         self._create_variable_beta_gamma()
         self._build_function_c()
         self._build_restrictions()
+        self._set_stats('build', start)
 
+        if execute:
+            self.execute()
+            self.calculation()
+
+    def execute(self):
+        """
+        Решает построенную задачу и сохраняет коэффициенты и ошибки в результат.
+        """
+        start = time.perf_counter()
         self._execute()
+        self._set_stats('solve', start)
+        self.result.stats['status'] = pulp.LpStatus[self._problem.status]
+
         self._set_result()
 
-    def _create_variable_u_v(self):
-        for index in range(self.data.y.size):
+    def calculation(self):
+        """
+        Вычисляет агрегированные показатели результата (E, КСП, M).
+        """
+        start = time.perf_counter()
+        self.result.calculation(self.data.x, self.data.y, self.data.dtype)
+        self._set_stats('calculation', start)
+
+    def _set_stats(self, stage: str, start: float):
+        self.result.stats.setdefault('timings', {})[stage] = time.perf_counter() - start
+
+        if stage == 'build':
+            self.result.stats['rows'] = len(self._problem.constraints)
+            self.result.stats['cols'] = len(self._vars)
+            self.result.stats['nonzeros'] = sum(len(item) for item in self._problem.constraints.values())
+
+    def append(self, data: Data, execute: bool = True):
+        """
+        Дополняет решённую задачу новыми наблюдениями: добавляются только их
+        переменные u, v и строки-равенства. Решение начинается с предыдущего,
+        начальные значения u, v новых наблюдений берутся из их остатков.
+        :param data: данные, первые наблюдения которых совпадают с текущими.
+        :param execute: если False, то задача только дополняется.
+        """
+        start = time.perf_counter()
+        count = self.data.y.size
+        b, g = self._get_var_b_g()
+        a = np.array(b, dtype=np.float64) - np.array(g, dtype=np.float64)
+
+        self.data = data
+        self.result = Result()
+        self._create_variable_u_v(count)
+
+        cost_u, cost_v = self.data.get_costs()
+        params = []
+        for index in range(count, self.data.y.size):
+            params.append((self._vars.get(f'u{index}'), float(cost_u[index])))
+            params.append((self._vars.get(f'v{index}'), float(cost_v[index])))
+        self._problem.objective += pulp.LpAffineExpression(params)
+
+        residuals = self.data.y[count:] - self.data.x[count:] @ a
+        for index, residual in enumerate(residuals.tolist(), count):
+            self._vars[f'u{index}'].setInitialValue(max(residual, 0))
+            self._vars[f'v{index}'].setInitialValue(max(-residual, 0))
+            # Имена вида str(index) уже заняты ограничениями на коэффициенты.
+            self._add_row_restriction(index, f'row{index}')
+
+        self._warm_start = True
+        self._set_stats('build', start)
+        self.result.stats['warm_start'] = True
+
+        if execute:
+            self.execute()
+            self.calculation()
+
+    def set_tau(self, tau: float, execute: bool = True):
+        """
+        Меняет квантиль решённой задачи: пересобирается только функция цели,
+        решение начинается с предыдущего.
+        :param tau: новый квантиль.
+        :param execute: если False, то функция цели только заменяется.
+        """
+        start = time.perf_counter()
+        self.data.tau = tau
+        self.result = Result()
+        self._problem.setObjective(self._function_c())
+
+        self._warm_start = True
+        self._set_stats('build', start)
+        self.result.stats['warm_start'] = True
+
+        if execute:
+            self.execute()
+            self.calculation()
+
+    def add_to_function_c(self, coefficients: np.ndarray):
+        """
+        Добавляет к функции цели линейное слагаемое по коэффициентам α = β - γ.
+        :param coefficients: множители при α.
+        """
+        params = []
+        for index, value in enumerate(coefficients):
+            params.append((self._vars.get(f'b{index}'), float(value)))
+            params.append((self._vars.get(f'g{index}'), -float(value)))
+
+        self._problem.objective += pulp.LpAffineExpression(params)
+
+    @property
+    def objective(self) -> float:
+        return pulp.value(self._problem.objective)
+
+    def _create_variable_u_v(self, start: int = 0):
+        for index in range(start, self.data.y.size):
             var_name_u = f'u{index}'
             var_name_v = f'v{index}'
             self._vars.setdefault(var_name_u, pulp.LpVariable(var_name_u, lowBound=0))
@@ -246,53 +474,66 @@ class LpSolve:
             self._vars.setdefault(var_name_gamma, pulp.LpVariable(var_name_gamma, lowBound=0))
 
     def _build_function_c(self):
+        self._problem += self._function_c(), 'Функция цели'
+
+    def _function_c(self) -> pulp.LpAffineExpression:
         params = []
+        cost_u, cost_v = self.data.get_costs()
 
-        for index in range(self.data.y.size):
-            params.append((self._vars.get(f'u{index}'), 1))
-        for index in range(self.data.y.size):
-            params.append((self._vars.get(f'v{index}'), 1))
+        for index, cost in enumerate(cost_u.tolist()):
+            params.append((self._vars.get(f'u{index}'), cost))
+        for index, cost in enumerate(cost_v.tolist()):
+            params.append((self._vars.get(f'v{index}'), cost))
         for index in range(len(self.data.x[0])):
             params.append((self._vars.get(f'b{index}'), self.data.delta))
             params.append((self._vars.get(f'g{index}'), self.data.delta))
 
-        self._problem += pulp.LpAffineExpression(params), 'Функция цели'
+        return pulp.LpAffineExpression(params)
+
+    def _add_row_restriction(self, index: int, name: str):
+        params = []
+        for index_x in range(len(self.data.x[0])):
+            params.append((self._vars.get(f'b{index_x}'), self.data.x[index][index_x]))
+            params.append((self._vars.get(f'g{index_x}'), -1 * self.data.x[index][index_x]))
+        params.append((self._vars.get(f'u{index}'), 1))
+        params.append((self._vars.get(f'v{index}'), -1))
+
+        self._problem += pulp.LpAffineExpression(params) == self.data.y[index], name
 
     def _build_restrictions(self):
         index_restriction = 0
         for index in range(self.data.y.size):
-            params = []
-            for index_x in range(len(self.data.x[0])):
-                params.append((self._vars.get(f'b{index_x}'), self.data.x[index][index_x]))
-                params.append((self._vars.get(f'g{index_x}'), -1 * self.data.x[index][index_x]))
-            params.append((self._vars.get(f'u{index}'), 1))
-            params.append((self._vars.get(f'v{index}'), -1))
-
-            self._problem += pulp.LpAffineExpression(params) == self.data.y[index], str(index_restriction)
+            self._add_row_restriction(index, str(index_restriction))
             index_restriction += 1
 
-        index_restrictions = 0
-        for items in self.data.restriction.data:
+        restriction = self.data.restriction
+        for index, items in enumerate(restriction.get_rows()):
+            if not items:
+                continue
+
             params = []
-            for index in range(len(items)):
-                if items[index] != 0:
-                    params.append((self._vars.get(f'b{index}'), items[index]))
-                    params.append((self._vars.get(f'g{index}'), -1 * items[index]))
-
-            if params:
-                if self.data.restriction.operators[index_restrictions] == OperatorEnum.EQUALS:
-                    self._problem += pulp.LpAffineExpression(params) == self.data.restriction.b[index_restrictions], \
-                                     str(index_restriction + index_restrictions)
-                elif self.data.restriction.operators[index_restrictions] == OperatorEnum.MORE_OR_EQUAL:
-                    self._problem += pulp.LpAffineExpression(params) >= self.data.restriction.b[index_restrictions], \
-                                     str(index_restriction + index_restrictions)
-                elif self.data.restriction.operators[index_restrictions] == OperatorEnum.LESS_OR_EQUAL:
-                    self._problem += pulp.LpAffineExpression(params) <= self.data.restriction.b[index_restrictions], \
-                                     str(index_restriction + index_restrictions)
-                index_restrictions += 1
+            for col, value in items:
+                params.append((self._vars.get(f'b{col}'), value))
+                params.append((self._vars.get(f'g{col}'), -1 * value))
+
+            name = str(index_restriction + index)
+            operator, b = restriction.get_operator(index), restriction.get_item_b(index)
+            if operator == OperatorEnum.EQUALS:
+                self._problem += pulp.LpAffineExpression(params) == b, name
+            elif operator == OperatorEnum.MORE_OR_EQUAL:
+                self._problem += pulp.LpAffineExpression(params) >= b, name
+            elif operator == OperatorEnum.LESS_OR_EQUAL:
+                self._problem += pulp.LpAffineExpression(params) <= b, name
 
     def _execute(self):
-        self._problem.solve()
+        # rlimit процесса решателя CBC наследует относительно потребления родителя,
+        # поэтому время самого CBC ограничивается его параметром.
+        self._problem.solve(pulp.PULP_CBC_CMD(warmStart=self._warm_start, timeLimit=SOLVE_CPU_LIMIT or None,
+                                              timeMode='cpu'))
+        # Остановленная по времени задача получает статус Optimal с недоказанно оптимальным решением.
+        if SOLVE_CPU_LIMIT and self._problem.sol_status == pulp.LpSolutionIntegerFeasible:
+            raise SolveLimitExceeded(f'Решатель CBC остановлен по ограничению процессорного времени '
+                                     f'{SOLVE_CPU_LIMIT} с.')
 
     def _get_var_b_g(self):
         _vars = self._problem.variablesDict()
@@ -319,7 +560,185 @@ class LpSolve:
         for index in range(len(u)):
             self.result.eps.append(u[index] - v[index])
 
-        self.result.calculation(self.data.x, self.data.y)
+
+class FastLpSolve:
+    """
+    Приближённое решение задачи для большого количества наблюдений.
+    Сначала α находится методом IRLS (итеративно перевзвешенные наименьшие квадраты),
+    затем задача ЛП решается точно только по наблюдениям с наименьшими остатками.
+    Остальные наблюдения входят в функцию цели одним линейным слагаемым: знак их
+    остатка считается известным. Если после решения знак остатка какого-то из них
+    изменился, наблюдение переносится в точную часть и задача решается заново.
+    Значение такой задачи - нижняя граница оптимума, поэтому stats['objective_gap']
+    показывает, насколько найденное решение может уступать точному.
+    """
+
+    IRLS_ITERATIONS = 50
+    IRLS_TOLERANCE = 1e-7
+
+    data: Data
+    result: Result
+
+    def __init__(self, data: Data, execute: bool = True):
+        self.data = data
+        self.result = Result()
+
+        if execute:
+            self.execute()
+            self.calculation()
+
+    def execute(self):
+        start = time.perf_counter()
+        a = self._approximate()
+        self._set_stats('approximate', start)
+        self.result.stats['objective_approx'] = self._objective(a)
+
+        start = time.perf_counter()
+        a, bound = self._refine(a)
+        self._set_stats('solve', start)
+
+        if a is None:
+            # Уточнённая задача не решена (например, неограничена на малой выборке) - решаем точно,
+            # если полная модель помещается в память: заранее проверялся только размер уточнения.
+            check_model_size(*self.data.x.shape, len(self.data.restriction.entries))
+            solver = LpSolve(self.data, execute=False)
+            solver.execute()
+            self.result.stats.update({key: value for key, value in solver.result.stats.items() if key != 'timings'})
+            self.result.stats['timings'].update(solver.result.stats['timings'])
+            a = np.asarray(solver.result.a, dtype=np.float64)
+            bound = solver.objective
+
+        objective = self._objective(a)
+        self.result.stats['objective'] = objective
+        self.result.stats['objective_gap'] = max(objective - bound, 0.0) / objective if objective > 0 else 0.0
+
+        self.result.a = a.tolist()
+        self.result.eps = (self.data.y - self.data.x @ a).tolist()
+
+    def calculation(self):
+        start = time.perf_counter()
+        self.result.calculation(self.data.x, self.data.y, self.data.dtype)
+        self._set_stats('calculation', start)
+
+    def _set_stats(self, stage: str, start: float):
+        self.result.stats.setdefault('timings', {})[stage] = time.perf_counter() - start
+
+    def _objective(self, a: np.ndarray) -> float:
+        """
+        Значение функции цели исходной задачи: взвешенная сумма модулей ошибок
+        (со стоимостями u и v) и δ * сумма модулей α.
+        """
+        residuals = self.data.y - self.data.x @ a
+        return float(self._residual_costs(residuals) @ np.abs(residuals) + self.data.delta * np.abs(a).sum())
+
+    def _residual_costs(self, residuals: np.ndarray) -> np.ndarray:
+        """
+        Стоимость ошибки каждого наблюдения по знаку остатка.
+        """
+        cost_u, cost_v = self.data.get_costs()
+        return np.where(residuals >= 0, cost_u, cost_v)
+
+    def _approximate(self) -> np.ndarray:
+        """
+        IRLS: на каждой итерации c|r| заменяется на c r^2 / |r| с весами с прошлой итерации
+        (c - стоимость ошибки по её знаку), и α находится из нормальных уравнений.
+        Ограничения не учитываются.
+        """
+        x, y = self.data.x, self.data.y
+        floor = 1e-8 * (float(np.abs(y).mean()) or 1.0)
+
+        a = np.linalg.lstsq(x, y, rcond=None)[0]
+        best, best_objective = a, self._objective(a)
+        for _ in range(self.IRLS_ITERATIONS):
+            residuals = y - x @ a
+            weights = self._residual_costs(residuals) / np.maximum(np.abs(residuals), floor)
+            xw = x * weights[:, None]
+            lhs = xw.T @ x + np.diag(self.data.delta / np.maximum(np.abs(a), floor))
+            a = np.linalg.lstsq(lhs, xw.T @ y, rcond=None)[0]
+
+            objective = self._objective(a)
+            if objective < best_objective:
+                improvement = best_objective - objective
+                best, best_objective = a, objective
+                if improvement <= self.IRLS_TOLERANCE * best_objective:
+                    break
+            else:
+                break
+        return best
+
+    def _refine(self, a: np.ndarray):
+        """
+        Точное уточнение по наблюдениям с остатками около нуля.
+        :return: α и нижняя граница функции цели или (None, None), если задача не решена.
+        """
+        x, y = self.data.x, self.data.y
+        n, p = x.shape
+        size = min(n, max(int(FAST_SOLVE_ROWS_FACTOR * p * np.sqrt(n)), 10 * p))
+        tolerance = 1e-9 * (1 + float(np.abs(y).max()))
+
+        residuals = y - x @ a
+        signs = np.sign(residuals)
+        # Слагаемое остального наблюдения в функции цели: c_i * s_i * (y_i - x_i α).
+        cost_u, cost_v = self.data.get_costs()
+        signed_costs = np.where(signs > 0, cost_u, cost_v) * signs
+        exact = np.zeros(n, dtype=bool)
+        exact[np.argsort(np.abs(residuals))[:size]] = True
+        exact |= signs == 0
+
+        build = 0.0
+        for index in range(FAST_SOLVE_ROUNDS):
+            rest = ~exact
+            solver = LpSolve(self.data.subset(np.flatnonzero(exact)), execute=False)
+            solver.add_to_function_c(-(signed_costs[rest] @ x[rest]))
+            solver.execute()
+            build += solver.result.stats['timings']['build']
+
+            self.result.stats.update({key: value for key, value in solver.result.stats.items() if key != 'timings'})
+            self.result.stats['timings']['build'] = build
+            self.result.stats['refine_rows'] = int(exact.sum())
+            self.result.stats['refine_rounds'] = index + 1
+            if solver.result.stats['status'] != 'Optimal':
+                return None, None
+
+            a = np.asarray(solver.result.a, dtype=np.float64)
+            bound = solver.objective + float(signed_costs[rest] @ y[rest])
+
+            changed = rest & (signs * (y - x @ a) < -tolerance)
+            if not changed.any():
+                break
+            exact |= changed
+
+        return a, bound
+
+
+def _count_increasing_pairs(ranks: np.ndarray) -> int:
+    """
+    Считает пары i < j с ranks[i] < ranks[j] сортировкой слиянием снизу вверх.
+    Каждый уровень слияния обрабатывается целиком средствами numpy.
+    :param ranks: целые ранги от 0 до n - 1.
+    """
+    n = ranks.size
+    keys = ranks.astype(np.int64)
+    position = np.arange(n)
+    count = 0
+
+    width = 1
+    while width < n:
+        run = position // width
+        pair = run // 2
+        left = run % 2 == 0
+
+        # Левые серии отсортированы и идут по порядку, поэтому ключи pair * n + rank возрастают.
+        left_keys = pair[left] * n + keys[left]
+        right_pair = pair[~left] * n
+        count += int((np.searchsorted(left_keys, right_pair + keys[~left])
+                      - np.searchsorted(left_keys, right_pair)).sum())
+
+        merged = np.sort(pair * n + keys)
+        keys = merged - (position // (2 * width)) * n
+        width *= 2
+
+    return count
 
 
 # 5  1 6
@@ -8,6 +8,18 @@ class MenuTypes(enum.Enum):
     DATA = 'DATA'
     ANSWER = 'ANSWER'
     RESTRICTIONS = 'RESTRICTIONS'
+    HISTORY = 'HISTORY'
+
+
+class SolverEnum(str, enum.Enum):
+    EXACT = 'EXACT'  # Точное решение задачи ЛП по всем наблюдениям.
+    FAST = 'FAST'  # Приближённое решение IRLS с точным уточнением по наблюдениям около нуля.
+
+    @staticmethod
+    def build(value):
+        if not value:
+            return SolverEnum.EXACT
+        return SolverEnum(value)
 
 
 class MetaData:
@@ -21,58 +33,196 @@ class MetaData:
     menu_active_data: bool
     menu_active_answer: bool
     menu_active_restrictions: bool
+    menu_active_history: bool
 
-    load_data: list
+    dataset_id: str  # Идентификатор загруженной матрицы в хранилище наборов данных.
+    rows: int
+    cols: int
+    parent_dataset_id: str  # Набор, к которому были дописаны последние строки.
+    appended_rows: int  # Количество строк, дописанных к parent_dataset_id.
+    column_stats: dict  # Накопленные по столбцам count, sum, sum_squares, min, max.
 
     free_chlen: bool
     delta: float  # Малая положительная величина.
     var_y: int  # Индекс столбца, зависимой переменной. Начинается с 1.
+    solver: SolverEnum
+    tau: float  # Квантиль: доля стоимости положительных ошибок, 0.5 - МНМ.
+    weights_col: int  # Индекс столбца весов наблюдений или None. Начинается с 1.
 
     def __init__(self, data=None):
+        self._load_data = None
+        self.dataset_id = None
+        self.rows = None
+        self.cols = None
+        self.parent_dataset_id = None
+        self.appended_rows = 0
+        self.column_stats = None
+        self.solver = SolverEnum.EXACT
+        self.tau = 0.5
+        self.weights_col = None
+
         if data is not None:
             self.menu_active_main = MetaData.get_value(data, 'menu_active_main')
             self.menu_active_load = MetaData.get_value(data, 'menu_active_load')
             self.menu_active_data = MetaData.get_value(data, 'menu_active_data')
             self.menu_active_answer = MetaData.get_value(data, 'menu_active_answer')
             self.menu_active_restrictions = MetaData.get_value(data, 'menu_active_restrictions')
+            self.menu_active_history = MetaData.get_value(data, 'menu_active_history')
 
-            self.load_data = MetaData.get_value(data, 'load_data')
+            self.dataset_id = MetaData.get_value(data, 'dataset_id')
+            self.rows = MetaData.get_value(data, 'rows')
+            self.cols = MetaData.get_value(data, 'cols')
+            self.parent_dataset_id = MetaData.get_value(data, 'parent_dataset_id')
+            self.appended_rows = MetaData.get_value(data, 'appended_rows') or 0
+            self.column_stats = MetaData.get_value(data, 'column_stats')
 
             self.free_chlen = MetaData.get_value(data, 'free_chlen')
             self.delta = MetaData.get_value(data, 'delta')
             self.var_y = MetaData.get_value(data, 'var_y')
+            self.solver = SolverEnum.build(MetaData.get_value(data, 'solver'))
+            self.tau = MetaData.get_value(data, 'tau') or 0.5
+            self.weights_col = MetaData.get_value(data, 'weights_col')
+
+    @property
+    def load_data(self):
+        """
+        Загруженная матрица. Читается из хранилища наборов данных при первом обращении.
+        """
+        if self._load_data is None and self.dataset_id:
+            from server.dataset import get_store
+
+            self._load_data = get_store().get(self.dataset_id)
+        return self._load_data
+
+    def set_load_data(self, matrix, dataset_id: str = None):
+        """
+        Устанавливает загруженную матрицу.
+        :param matrix: матрица numpy.
+        :param dataset_id: идентификатор матрицы в хранилище наборов данных.
+        """
+        self._load_data = matrix
+        self.dataset_id = dataset_id
+        self.rows, self.cols = matrix.shape
+        self.parent_dataset_id = None
+        self.appended_rows = 0
+        self.column_stats = None
+        self.weights_col = None
+
+    def append_load_data(self, rows, dataset_id: str):
+        """
+        Переходит на набор, дополненный новыми строками. Текущий набор запоминается
+        как родительский, чтобы решатель мог дополнить уже решённую задачу.
+        Матрица читается из хранилища при следующем обращении.
+        :param rows: дописанные строки.
+        :param dataset_id: идентификатор дополненного набора в хранилище наборов данных.
+        """
+        self.parent_dataset_id = self.dataset_id
+        self.dataset_id = dataset_id
+        self._load_data = None
+        self.rows += len(rows)
+        self.appended_rows = len(rows)
+        self.update_column_stats(rows)
+
+    def update_column_stats(self, rows):
+        """
+        Добавляет строки в накопленную статистику столбцов без повторного чтения всей матрицы.
+        :param rows: новые строки матрицы.
+        """
+        import numpy as np
+
+        # Суммы накапливаются в float64 без копии матрицы float32 в float64.
+        rows = np.asarray(rows)
+        stats = {
+            'count': len(rows),
+            'sum': rows.sum(axis=0, dtype=np.float64).tolist(),
+            'sum_squares': np.einsum('ij,ij->j', rows, rows, dtype=np.float64).tolist(),
+            'min': rows.min(axis=0).tolist(),
+            'max': rows.max(axis=0).tolist(),
+        }
+
+        if self.column_stats:
+            previous = self.column_stats
+            stats = {
+                'count': previous['count'] + stats['count'],
+                'sum': list(map(lambda a, b: a + b, previous['sum'], stats['sum'])),
+                'sum_squares': list(map(lambda a, b: a + b, previous['sum_squares'], stats['sum_squares'])),
+                'min': list(map(min, previous['min'], stats['min'])),
+                'max': list(map(max, previous['max'], stats['max'])),
+            }
+        self.column_stats = stats
+
+    def get_column_stats(self) -> list:
+        """
+        Получает по каждому столбцу среднее, стандартное отклонение, минимум и максимум.
+        """
+        if not self.column_stats:
+            return []
+
+        stats = self.column_stats
+        count = stats['count']
+        result = []
+        for index in range(len(stats['sum'])):
+            mean = stats['sum'][index] / count
+            variance = max(stats['sum_squares'][index] / count - mean * mean, 0)
+            result.append({
+                'mean': mean,
+                'std': variance ** 0.5,
+                'min': stats['min'][index],
+                'max': stats['max'][index],
+            })
+        return result
+
+    def has_load_data(self) -> bool:
+        return bool(self.rows)
 
     def get_load_data_len(self):
         """
         Получает массив индексов столбцов загруженной матрицы.
         Значения в массиве начинается с 1.
         """
-        return list(map(int, range(1, len(self.load_data[0]) + 1)))
+        return list(map(int, range(1, self.cols + 1)))
 
     def get_load_data_rows_len(self):
         """
         Получает массив индексов строк загруженной матрицы.
         Значения в массиве начинается с 1.
         """
-        return list(map(int, range(1, len(self.load_data) + 1)))
+        return list(map(int, range(1, self.rows + 1)))
+
+    def get_pages_count(self, page_size: int) -> int:
+        return max(1, -(-self.rows // page_size))
+
+    def get_load_data_page(self, page: int, page_size: int) -> list:
+        """
+        Получает строки одной страницы загруженной матрицы.
+        Для хранилища на диске читаются только страницы файла с этими строками.
+        :param page: номер страницы, начинается с 1.
+        :param page_size: количество строк на странице.
+        :return: список пар (номер строки, начиная с 1; значения строки).
+        """
+        start = (page - 1) * page_size
+        rows = self.load_data[start:start + page_size].tolist()
+        return list(zip(range(start + 1, start + len(rows) + 1), rows))
 
     def get_load_data_free_chlen_len(self):
         """
-        Получает массив индексов столбцов загруженной матрицы.
+        Получает массив индексов столбцов загруженной матрицы без столбца весов.
         Значения в массиве начинается с 1.
         """
+        cols = self.cols - (1 if self.weights_col else 0)
         if self.free_chlen:
-            return list(map(int, range(len(self.load_data[0]) + 1)))
-        return list(map(int, range(1, len(self.load_data[0]) + 1)))
+            return list(map(int, range(cols + 1)))
+        return list(map(int, range(1, cols + 1)))
 
     def get_work_data_free_chlen_len(self):
         """
-        Получает массив индексов столбцов загруженной матрицы.
+        Получает массив индексов столбцов загруженной матрицы без столбца весов.
         Значения в массиве начинается с 1.
         """
+        cols = self.cols - (1 if self.weights_col else 0)
         if self.free_chlen:
-            return list(map(int, range(len(self.load_data[0]))))
-        return list(map(int, range(1, len(self.load_data[0]))))
+            return list(map(int, range(cols)))
+        return list(map(int, range(1, cols)))
 
     def set_active_menu(self, menu_type: MenuTypes):
         self._drop_active_menu()
@@ -87,6 +237,8 @@ class MetaData:
             self.menu_active_answer = True
         elif menu_type == MenuTypes.RESTRICTIONS:
             self.menu_active_restrictions = True
+        elif menu_type == MenuTypes.HISTORY:
+            self.menu_active_history = True
 
     def set_free_chlen(self, form):
         if self.get_value(form, 'free_chlen'):
@@ -95,9 +247,45 @@ class MetaData:
             self.free_chlen = False
 
     def set_data(self, form):
+        """
+        Заполняет параметры задачи из формы.
+        :raises ValueError: τ вне (0, 1) или столбец весов не подходит; параметры не меняются.
+        """
+        tau = float(self.get_value(form, 'tau')) if self.get_value(form, 'tau') else 0.5
+        weights_col = int(self.get_value(form, 'weights_col')) if self.get_value(form, 'weights_col') else None
+        var_y = int(self.get_value(form, 'var_y')) if self.get_value(form, 'var_y') else 1
+        self.check_tau(tau)
+        if weights_col is not None:
+            self.check_weights_col(weights_col, var_y)
+
         self.set_free_chlen(form)
         self.delta = float(self.get_value(form, 'delta')) if self.get_value(form, 'delta') else 0.1
-        self.var_y = int(self.get_value(form, 'var_y')) if self.get_value(form, 'var_y') else 1
+        self.var_y = var_y
+        self.solver = SolverEnum.build(self.get_value(form, 'solver'))
+        self.tau = tau
+        self.weights_col = weights_col
+
+    @staticmethod
+    def check_tau(tau: float):
+        if not 0 < tau < 1:
+            raise ValueError('Квантиль τ должен быть в интервале (0, 1).')
+
+    def check_weights_col(self, weights_col: int, var_y: int):
+        """
+        Проверяет столбец весов по накопленной статистике: веса не могут быть отрицательными.
+        """
+        if not 1 <= weights_col <= (self.cols or 0):
+            raise ValueError(f'Номер столбца весов должен быть от 1 до {self.cols}.')
+        if weights_col == var_y:
+            raise ValueError('Столбец весов не может быть зависимой переменной.')
+        if self.column_stats and self.column_stats['min'][weights_col - 1] < 0:
+            raise ValueError('Веса наблюдений должны быть неотрицательными.')
+
+    def get_regressor_cols(self) -> list:
+        """
+        Получает индексы столбцов-регрессоров (без зависимой переменной и весов). Начинаются с 0.
+        """
+        return [index for index in range(self.cols) if index + 1 not in (self.var_y, self.weights_col)]
 
     def _drop_active_menu(self):
         self.menu_active_main = False
@@ -105,6 +293,7 @@ class MetaData:
         self.menu_active_data = False
         self.menu_active_answer = False
         self.menu_active_restrictions = False
+        self.menu_active_history = False
 
     @staticmethod
     def get_value(data, key):
@@ -116,14 +305,22 @@ class MetaData:
     def __str__(self):
         return json.dumps(self, cls=MetaData.DataEncoder)
 
+    def __getstate__(self):
+        # Матрица не передаётся между процессами, она читается из хранилища по dataset_id.
+        state = self.__dict__.copy()
+        if state.get('dataset_id'):
+            state['_load_data'] = None
+        return state
+
     class DataEncoder(json.JSONEncoder):
         """
         Класс кодирует модель MetaData в JSON формат.
+        Закрытые поля (кэш матрицы) не сохраняются.
         """
 
         def default(self, obj):
             if isinstance(obj, MetaData):
-                return obj.__dict__
+                return {key: value for key, value in obj.__dict__.items() if not key.startswith('_')}
             return json.JSONEncoder.default(self, obj)
 
 
@@ -141,26 +338,32 @@ class OperatorEnum(str, enum.Enum):
 
 class Restriction:
     """
-    Сущность ограничений.
+    Сущность ограничений на коэффициенты α.
+    Матрица ограничений хранится разреженно: только ненулевые элементы
+    в виде троек [строка, столбец, значение], упорядоченных по строке и столбцу.
     """
 
     x: int  # количество элементов в строке
     y: int  # количество строк
-    data: list
+    entries: list  # Ненулевые элементы [строка, столбец, значение], индексы начинаются с 0.
     operators: list
     b: list
 
     def __init__(self, x: int = 0, data=None):
         if data is not None:
-            self.data = Restriction.get_value(data, 'data')
             self.x = Restriction.get_value(data, 'x')
             self.y = Restriction.get_value(data, 'y')
             self.operators = Restriction.get_value(data, 'operators')
             self.b = Restriction.get_value(data, 'b')
+            self.entries = Restriction.get_value(data, 'entries')
+            if self.entries is None:
+                # Ограничения, сохранённые плотной матрицей data.
+                self.entries = [[y, x, value] for y, line in enumerate(Restriction.get_value(data, 'data') or [])
+                                for x, value in enumerate(line) if value != 0]
         else:
             self.x = x
             self.y = 1
-            self.data = []
+            self.entries = []
             self.operators = []
             self.b = []
 
@@ -185,11 +388,21 @@ class Restriction:
         """
         return list(map(int, range(0, self.y)))
 
-    def get_item_data(self, y: int, x: int) -> float:
-        try:
-            return self.data[y][x]
-        except Exception:
-            return 0
+    def get_rows(self) -> list:
+        """
+        Получает ненулевые элементы по строкам ограничений.
+        :return: список строк, каждая - список пар (столбец, значение).
+        """
+        rows = [[] for _ in range(self.y)]
+        for y, x, value in self.entries:
+            rows[y].append((x, value))
+        return rows
+
+    def get_count(self) -> int:
+        """
+        Получает количество ограничений с ненулевыми коэффициентами.
+        """
+        return len({y for y, _, _ in self.entries})
 
     def get_item_b(self, y: int) -> float:
         try:
@@ -198,11 +411,18 @@ class Restriction:
             return 0
 
     def get_operator(self, y: int):
-        if len(self.operators) == 0 or y > len(self.operators):
+        if len(self.operators) == 0 or y >= len(self.operators):
             return OperatorEnum.EQUALS
 
         return self.operators[y]
 
+    def resize(self, x: int):
+        """
+        Изменяет количество коэффициентов в строке. Элементы за её пределами удаляются.
+        """
+        self.x = x
+        self.entries = [entry for entry in self.entries if entry[1] < x]
+
     def add_restriction(self):
         self.y += 1
         self.operators.append(OperatorEnum.EQUALS)
@@ -212,28 +432,76 @@ class Restriction:
         self.y = self.y if self.y >= 0 else 0
 
         if self.y == 0:
-            self.data = []
+            self.entries = []
             self.operators = []
             self.b = []
         else:
-            del self.data[-1]
-            del self.operators[-1]
-            del self.b[-1]
+            self.entries = [entry for entry in self.entries if entry[0] < self.y]
+            del self.operators[self.y:]
+            del self.b[self.y:]
 
     def set_data(self, form):
-        self.data = []
+        """
+        Заполняет ограничения из формы. Поля a_{y}_{x} передаются только для
+        ненулевых элементов (нулевое значение удаляет элемент), new_col_{y}
+        и new_value_{y} добавляют элемент в строку y.
+        """
+        entries = {}
+        for key, value in form.items():
+            if not key.startswith('a_') or value in ('', None):
+                continue
+            _, y, x = key.split('_')
+            entries[(int(y), int(x))] = float(value)
+
         self.b = []
         self.operators = []
-
         for y in range(self.y):
-            line = []
-            for x in range(self.x):
-                line.append(float(self.get_value(form, f'a_{y}_{x}')))
-            self.data.append(line)
+            new_col, new_value = self.get_value(form, f'new_col_{y}'), self.get_value(form, f'new_value_{y}')
+            if new_col not in ('', None) and new_value not in ('', None):
+                entries[(y, int(new_col))] = float(new_value)
 
             self.b.append(float(self.get_value(form, f'b_{y}')))
             self.operators.append(OperatorEnum.build(self.get_value(form, f'operator_{y}')))
 
+        self.entries = [[y, x, value] for (y, x), value in sorted(entries.items())
+                        if value != 0 and y < self.y and 0 <= x < self.x]
+
+    def set_entries(self, entries: list, operators: list, b: list):
+        """
+        Заменяет все ограничения (массовый импорт).
+        :param entries: элементы (строка, столбец, значение); нулевые пропускаются,
+                        для повторяющихся позиций берётся последнее значение.
+        :param operators: операторы строк (OperatorEnum или их имена).
+        :param b: правые части строк.
+        :raises ValueError: размеры не согласованы или индексы вне матрицы.
+        """
+        if len(operators) != len(b):
+            raise ValueError('Для каждого ограничения нужны оператор и правая часть.')
+        y = len(b)
+
+        try:
+            entries = [(int(row), int(col), float(value)) for row, col, value in entries]
+            b = [float(value) for value in b]
+        except (TypeError, ValueError):
+            raise ValueError('Элемент ограничения должен состоять из номеров строки и столбца и числа.')
+        try:
+            operators = [OperatorEnum.build(operator) for operator in operators]
+        except ValueError:
+            raise ValueError(f'Оператор должен быть одним из: {", ".join(item.value for item in OperatorEnum)}.')
+
+        values = {}
+        for row, col, value in entries:
+            if not 0 <= row < y:
+                raise ValueError(f'Номер ограничения {row} вне диапазона от 0 до {y - 1}.')
+            if not 0 <= col < self.x:
+                raise ValueError(f'Номер коэффициента {col} вне диапазона от 0 до {self.x - 1}.')
+            values[(row, col)] = value
+
+        self.y = y
+        self.entries = [[row, col, value] for (row, col), value in sorted(values.items()) if value != 0]
+        self.operators = operators
+        self.b = b
+
     class DataEncoder(json.JSONEncoder):
         """
         Класс кодирует модель Restriction в JSON формат.
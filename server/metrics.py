@@ -0,0 +1,148 @@
+import bisect
+import threading
+import time
+
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+MEMORY_BUCKETS = tuple(2 ** power * 1024 * 1024 for power in range(4, 15))
+
+
+class Counter:
+    """
+    Монотонно возрастающий счётчик с метками.
+    """
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(key)} {value}')
+        return lines
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами корзин и метками.
+    """
+
+    def __init__(self, name: str, description: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_format_labels(key, le=bound)} {cumulative}')
+                cumulative += counts[-1]
+                lines.append(f'{self.name}_bucket{_format_labels(key, le="+Inf")} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {cumulative}')
+        return lines
+
+
+def _format_labels(key: tuple, **extra) -> str:
+    items = list(key) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+
+REQUEST_SECONDS = Histogram('mnm_request_seconds', 'Время обработки HTTP-запроса.')
+STAGE_SECONDS = Histogram('mnm_stage_seconds', 'Время выполнения этапа обработки запроса.')
+REDIS_COMMANDS = Counter('mnm_redis_commands_total', 'Количество обращений к Redis.')
+REDIS_SECONDS = Histogram('mnm_redis_command_seconds', 'Время обращения к Redis.')
+REDIS_PER_REQUEST = Histogram('mnm_redis_roundtrips_per_request', 'Количество обращений к Redis за запрос.',
+                              COUNT_BUCKETS)
+LP_SIZE = Histogram('mnm_lp_size', 'Размер задачи линейного программирования.', SIZE_BUCKETS)
+SOLVER_STATUS = Counter('mnm_solver_status_total', 'Статусы завершения решателя.')
+SOLVE_REJECTED = Counter('mnm_solve_rejected_total', 'Решения, отклонённые из-за заполненной очереди.')
+SOLVE_PEAK_RSS = Histogram('mnm_solve_peak_rss_bytes', 'Пиковая память процесса решателя за решение.', MEMORY_BUCKETS)
+SOLVE_LIMIT_EXCEEDED = Counter('mnm_solve_limit_exceeded_total',
+                               'Решения, отклонённые или прерванные из-за ограничений памяти и времени.')
+
+REGISTRY = [REQUEST_SECONDS, STAGE_SECONDS, REDIS_COMMANDS, REDIS_SECONDS, REDIS_PER_REQUEST, LP_SIZE, SOLVER_STATUS,
+            SOLVE_REJECTED, SOLVE_PEAK_RSS, SOLVE_LIMIT_EXCEEDED]
+
+_local = threading.local()
+
+
+@contextmanager
+def timer(stage: str):
+    """
+    Замеряет время выполнения блока и записывает его в гистограмму этапов.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def request_started():
+    _local.redis_roundtrips = 0
+
+
+def request_finished(endpoint: str, seconds: float):
+    REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+    REDIS_PER_REQUEST.observe(getattr(_local, 'redis_roundtrips', 0), endpoint=endpoint)
+
+
+def redis_roundtrip(command: str, seconds: float):
+    REDIS_COMMANDS.inc(command=command)
+    REDIS_SECONDS.observe(seconds, command=command)
+    _local.redis_roundtrips = getattr(_local, 'redis_roundtrips', 0) + 1
+
+
+def observe_solve(stats: dict):
+    """
+    Записывает статистику решения, собранную в Result.stats.
+    Статистика передаётся через результат, так как решение может
+    выполняться в другом процессе.
+    """
+    if not stats:
+        return
+
+    for stage, seconds in stats.get('timings', {}).items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    for dimension in ('rows', 'cols', 'nonzeros'):
+        if dimension in stats:
+            LP_SIZE.observe(stats[dimension], dimension=dimension)
+    if 'status' in stats:
+        SOLVER_STATUS.inc(status=stats['status'])
+    if stats.get('peak_rss'):
+        SOLVE_PEAK_RSS.observe(stats['peak_rss'])
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,38 @@
+import base64
+
+import numpy as np
+
+from server.config import MATRIX_PRECISION
+
+PRECISIONS = ('float64', 'float32')
+
+
+def storage_dtype(precision: str = None) -> np.dtype:
+    """
+    Получает тип хранения загруженных матриц.
+    :param precision: float64 или float32; по умолчанию MATRIX_PRECISION.
+    :raises ValueError: неизвестная точность.
+    """
+    precision = precision or MATRIX_PRECISION
+    if precision not in PRECISIONS:
+        raise ValueError(f'Точность хранения должна быть одной из: {", ".join(PRECISIONS)}.')
+    return np.dtype(precision)
+
+
+def result_dtype(matrix: np.ndarray) -> np.dtype:
+    """
+    Получает тип ошибок и расчётных значений результата по типу загруженной матрицы:
+    для float32 - float32, для остальных - float64.
+    """
+    return np.dtype(np.float32) if matrix.dtype == np.float32 else np.dtype(np.float64)
+
+
+def encode_array(values, dtype: str = 'float64') -> str:
+    """
+    Кодирует массив значений в base64 байтов заданного типа.
+    """
+    return base64.b64encode(np.asarray(values, dtype=dtype).tobytes()).decode('ascii')
+
+
+def decode_array(data: str, dtype: str = 'float64') -> list:
+    return np.frombuffer(base64.b64decode(data), dtype=dtype).tolist()
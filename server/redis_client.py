@@ -0,0 +1,65 @@
+import threading
+import time
+
+import redis
+
+from server import metrics
+from server.config import REDIS_HOST, REDIS_PORT
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Клиент Redis, который учитывает количество и время обращений к серверу.
+    """
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            metrics.redis_roundtrip(str(args[0]).lower(), time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    """
+    Конвейер команд Redis: весь конвейер учитывается как одно обращение.
+    """
+
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            metrics.redis_roundtrip('pipeline', time.perf_counter() - start)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_redis(decode_responses: bool = True) -> redis.Redis:
+    """
+    Получает клиент Redis с общим для процесса пулом соединений.
+    :param decode_responses: декодировать ответы в строки; для бинарных данных - False.
+    """
+
+    with _pools_lock:
+        pool = _pools.get(decode_responses)
+        if pool is None:
+            pool = redis.ConnectionPool(decode_responses=decode_responses, host=REDIS_HOST, port=REDIS_PORT)
+            _pools[decode_responses] = pool
+    return InstrumentedRedis(connection_pool=pool)
+
+
+def set_pools(pools: dict):
+    """
+    Заменяет пулы соединений процесса, например на пулы fakeredis в нагрузочном тесте.
+    :param pools: пулы по значению decode_responses.
+    """
+
+    with _pools_lock:
+        _pools.clear()
+        _pools.update(pools)
@@ -1,12 +1,21 @@
 import datetime
 import json
+import threading
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING
 
 import jwt
 import redis
 
-from server.lp import Result
+from server import metrics
+from server.redis_client import get_redis
+from server.history import ResultHistory
 from server.meta_data import MetaData, Restriction
-from server.config import REDIS_HOST, REDIS_PORT, SECRET_JWT
+from server.config import SECRET_JWT, TOKEN_CACHE_SIZE
+
+if TYPE_CHECKING:
+    from server.lp import Result
 
 
 class Token:
@@ -34,17 +43,67 @@ class Token:
         return self.body
 
 
+class TokenCache:
+    """
+    LRU-кэш проверенных токенов процесса. Повторные запросы того же браузера
+    не проверяют подпись JWT и существование сессии в Redis до момента
+    истечения сессии (04:00 следующего дня после создания токена).
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, body: str):
+        with self._lock:
+            item = self._items.get(body)
+            if item is None:
+                return None
+
+            token, expire_at = item
+            if datetime.datetime.now() >= expire_at:
+                del self._items[body]
+                return None
+
+            self._items.move_to_end(body)
+            return token
+
+    def put(self, token: Token):
+        if self.size <= 0:
+            return
+
+        with self._lock:
+            self._items[token.body] = (token, Session.expire_at_for(token.create_time))
+            self._items.move_to_end(token.body)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
 class Session:
     """
     Кастомная сессия пользователя.
+    Все данные сессии хранятся в одном хэше Redis с ключом, равным токену:
+    created, meta_data, result, restriction, версии данных и result_source.
+    Время жизни хэша задаётся один раз при создании сессии.
     """
 
     token: Token
     _meta_data: MetaData
-    _result: Result
+    _result: 'Result'
     _restriction: Restriction
+    _history: ResultHistory
+    _versions: dict
+
+    VERSION_FIELDS = ['version_meta_data', 'version_restriction', 'version_result', 'result_source']
+    # Ключи сессии прежнего формата: строка с ключом токена и отдельные строки полей.
+    LEGACY_SUFFIXES = ['', '_metaData', '_result', '_restriction']
 
-    def __init__(self, token: Token = None):
+    def __init__(self, token: Token = None, versions: list = None):
         if token is None:
             self.create_token()
         else:
@@ -53,15 +112,15 @@ class Session:
         self._meta_data = None
         self._result = None
         self._restriction = None
+        self._history = None
+        self._versions = Session._build_versions(versions) if versions is not None else None
 
     @property
     def meta_data(self) -> MetaData:
-        r = Session._get_redis()
-        _data = r.get(f'{self.token.body}_metaData')
-        if _data != "" and _data is not None and 'meta_data' in json.loads(_data):
-            self._meta_data = MetaData(json.loads(_data)['meta_data'])
-        else:
-            self._meta_data = MetaData()
+        if self._meta_data is None:
+            _data = self._get_field('meta_data')
+            with metrics.timer('session_decode_meta_data'):
+                self._meta_data = MetaData(json.loads(_data)) if _data else MetaData()
 
         return self._meta_data
 
@@ -72,30 +131,29 @@ class Session:
         self.save_meta_data()
 
     @property
-    def result(self) -> Result:
-        r = Session._get_redis()
-        _data = r.get(f'{self.token.body}_result')
-        if _data != "" and _data is not None and 'result' in json.loads(_data):
-            self._result = Result.new_result(json.loads(_data)['result'])
-        else:
-            self._result = Result.new_result()
+    def result(self) -> 'Result':
+        # numpy и pulp импортируются только при первом обращении к результату.
+        from server.lp import Result
+
+        if self._result is None:
+            _data = self._get_field('result')
+            with metrics.timer('session_decode_result'):
+                self._result = Result.new_result(json.loads(_data)) if _data else Result.new_result()
 
         return self._result
 
     @result.setter
-    def result(self, new_result: Result):
+    def result(self, new_result: 'Result'):
         self._result = new_result
 
         self.save_result()
 
     @property
     def restriction(self) -> Restriction:
-        r = Session._get_redis()
-        _data = r.get(f'{self.token.body}_restriction')
-        if _data != "" and _data is not None and 'restriction' in json.loads(_data):
-            self._restriction = Restriction(data=json.loads(_data)['restriction'])
-        else:
-            self._restriction = Restriction()
+        if self._restriction is None:
+            _data = self._get_field('restriction')
+            with metrics.timer('session_decode_restriction'):
+                self._restriction = Restriction(data=json.loads(_data)) if _data else Restriction()
 
         return self._restriction
 
@@ -105,59 +163,135 @@ class Session:
 
         self.save_restriction()
 
+    @property
+    def history(self) -> ResultHistory:
+        """
+        История результатов сессии.
+        """
+        if self._history is None:
+            self._history = ResultHistory(self.token.body, Session.expire_at_for(self.token.create_time))
+
+        return self._history
+
     def create_token(self):
         self.token = Token()
-        r = Session._get_redis()
-        r.set(
-            self.token.body, "")
-        r.expireat(
-            self.token.body,
-            datetime.datetime.fromisoformat(f'{datetime.date.today() + datetime.timedelta(days=1)} 04:00:00'))
-        r.close()
+        pipe = Session._get_redis().pipeline(transaction=False)
+        pipe.hset(self.token.body, 'created', str(self.token.create_time))
+        pipe.expireat(self.token.body, Session.expire_at_for(self.token.create_time))
+        pipe.execute()
+
+        _token_cache.put(self.token)
 
     @staticmethod
     def get_session(_token: str):
+        """
+        Восстанавливает сессию по токену. Проверка существования сессии
+        совмещена с первым чтением: вместе с полем created читаются версии данных.
+        Уже проверенные этим процессом токены берутся из кэша без обращения к Redis.
+        Сессия прежнего формата (строковый ключ) считается истёкшей: её ключи удаляются
+        и создаётся новая сессия.
+        """
+        token = _token_cache.get(_token)
+        if token is not None:
+            return Session(token)
+
         try:
             token = Token(_token)
 
             r = Session._get_redis()
-            data = r.get(token.body)
-            if data is None:
-                r.close()
+            data = r.hmget(token.body, ['created'] + Session.VERSION_FIELDS)
+            if data[0] is None:
                 return Session()
-            r.close()
-            return Session(token)
+
+            _token_cache.put(token)
+            return Session(token, data[1:])
 
         except jwt.exceptions.InvalidSignatureError:
             return Session()
+        except redis.ResponseError:
+            # WRONGTYPE: по токену хранится не хэш, а сессия прежнего формата.
+            Session._get_redis().delete(*[f'{_token}{suffix}' for suffix in Session.LEGACY_SUFFIXES])
+            return Session()
 
-    def save_meta_data(self):
+    @property
+    def versions(self) -> dict:
+        """
+        Получает номера версий данных сессии. Версия увеличивается при каждом
+        сохранении метаданных, ограничений или результата и используется
+        для ETag страниц и для проверки актуальности сохранённого результата.
+        """
+        if self._versions is None:
+            r = Session._get_redis()
+            self._versions = Session._build_versions(r.hmget(self.token.body, Session.VERSION_FIELDS))
+
+        return self._versions
+
+    def set_result_source(self, source: str):
+        """
+        Запоминает, для какой версии метаданных и ограничений получен сохранённый результат.
+        """
         r = Session._get_redis()
-        r.set(f'{self.token.body}_metaData', f'{{"meta_data":{json.dumps(self._meta_data, cls=MetaData.DataEncoder)}}}')
-        r.expireat(
-            f'{self.token.body}_metaData',
-            datetime.datetime.fromisoformat(f'{datetime.date.today() + datetime.timedelta(days=1)} 04:00:00'))
-        r.close()
+        r.hset(self.token.body, 'result_source', source)
+        if self._versions is not None:
+            self._versions['result_source'] = source
+
+    def save_meta_data(self):
+        with metrics.timer('session_encode_meta_data'):
+            _data = json.dumps(self._meta_data, cls=MetaData.DataEncoder)
+        self._save('meta_data', _data)
 
     def save_result(self):
-        r = Session._get_redis()
-        r.set(f'{self.token.body}_result', f'{{"result":{json.dumps(self._result, cls=Result.DataEncoder)}}}')
-        r.expireat(
-            f'{self.token.body}_result',
-            datetime.datetime.fromisoformat(f'{datetime.date.today() + datetime.timedelta(days=1)} 04:00:00'))
-        r.close()
+        from server.lp import Result
+
+        with metrics.timer('session_encode_result'):
+            _data = json.dumps(self._result, cls=Result.DataEncoder)
+        self._save('result', _data)
 
     def save_restriction(self):
+        with metrics.timer('session_encode_restriction'):
+            _data = json.dumps(self._restriction, cls=Restriction.DataEncoder)
+        self._save('restriction', _data)
+
+    def _get_field(self, field: str):
         r = Session._get_redis()
-        r.set(f'{self.token.body}_restriction', f'{{"restriction":{json.dumps(self._restriction, cls=Restriction.DataEncoder)}}}')
-        r.expireat(
-            f'{self.token.body}_restriction',
-            datetime.datetime.fromisoformat(f'{datetime.date.today() + datetime.timedelta(days=1)} 04:00:00'))
-        r.close()
+        return r.hget(self.token.body, field)
+
+    def _save(self, field: str, data: str):
+        """
+        Сохраняет поле сессии и увеличивает его версию за одно обращение к Redis.
+        """
+        pipe = Session._get_redis().pipeline(transaction=False)
+        pipe.hset(self.token.body, field, data)
+        pipe.hincrby(self.token.body, f'version_{field}', 1)
+        pipe.ttl(self.token.body)
+        _, version, ttl = pipe.execute()
+
+        if ttl == -1:
+            # Хэш истёк между чтением и записью и создан заново без времени жизни.
+            Session._get_redis().expireat(self.token.body, Session.expire_at_for(self.token.create_time))
+        if self._versions is not None:
+            self._versions[field] = version
+
+    @staticmethod
+    def _build_versions(values: list) -> dict:
+        meta_data, restriction, result, result_source = values
+        return {
+            'meta_data': int(meta_data or 0),
+            'restriction': int(restriction or 0),
+            'result': int(result or 0),
+            'result_source': result_source,
+        }
+
+    @staticmethod
+    def expire_at_for(create_time: datetime.datetime) -> datetime.datetime:
+        """
+        Время истечения сессии: 04:00 следующего дня после создания токена.
+        """
+        return datetime.datetime.combine(create_time.date() + datetime.timedelta(days=1), datetime.time(4))
 
     @staticmethod
     def _get_redis() -> redis.Redis:
-        return redis.Redis(decode_responses=True, host=REDIS_HOST, port=REDIS_PORT)
+        return get_redis()
 
     class DataEncoder(json.JSONEncoder):
         """
@@ -167,3 +301,6 @@ class Session:
             if isinstance(obj, Session):
                 return obj.__dict__
             return json.JSONEncoder.default(self, obj)
+
+
+_token_cache = TokenCache(TOKEN_CACHE_SIZE)
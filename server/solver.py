@@ -0,0 +1,411 @@
+import json
+import multiprocessing
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING
+
+from server import metrics
+from server.limits import SolveLimitExceeded, accounted, check_model_size, limited, predict_model_bytes
+from server.meta_data import MetaData, Restriction, SolverEnum
+from server.config import SOLVE_WORKERS, SOLVE_QUEUE_DEPTH, SOLVE_MODEL_CACHE_SIZE, SOLVE_BACKEND, SOLVE_MEMORY_LIMIT
+
+if TYPE_CHECKING:
+    from server.lp import Data, MultiResult, Result
+
+
+class SolverBusy(Exception):
+    """
+    Очередь решений заполнена, новая задача не принимается.
+    """
+
+
+class SolveFailed(Exception):
+    """
+    Задача не решена: воркеры очереди исчерпали все попытки.
+    """
+
+
+_executor: ProcessPoolExecutor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(SOLVE_WORKERS, 1) + SOLVE_QUEUE_DEPTH)
+
+# Решённые модели процесса решателя для дополнения новыми строками: ключ - набор данных и настройки задачи,
+# значение - модель и прогноз занятой ею памяти.
+_models = OrderedDict()
+_models_lock = threading.Lock()
+
+
+def solve(meta_data: MetaData, restriction: Restriction, submit_time: float = None) -> 'Result':
+    """
+    Строит и решает задачу. Выполняется в процессе пула решателя.
+    :param meta_data: метаданные клиента с исходной матрицей.
+    :param restriction: ограничения.
+    :param submit_time: время постановки задачи в очередь (time.time()).
+    :return: результат решения.
+    """
+    from server.lp import Data, FastLpSolve
+
+    queue_wait = time.time() - submit_time if submit_time is not None else 0
+
+    with accounted({}) as stats:
+        start = time.perf_counter()
+        data = Data(meta_data, restriction)
+        data_time = time.perf_counter() - start
+
+        if data.solver == SolverEnum.FAST:
+            result = FastLpSolve(data).result
+        else:
+            result = _solve_exact(meta_data, restriction, data)
+    result.stats.update(stats)
+    result.stats['timings']['data'] = data_time
+    result.stats['timings']['queue_wait'] = queue_wait
+    return result
+
+
+def run_limited(function, *args):
+    """
+    Выполняет решение с ограничениями SOLVE_MEMORY_LIMIT и SOLVE_CPU_LIMIT
+    (в процессе пула или воркере очереди).
+    :raises SolveLimitExceeded: превышено ограничение памяти или времени.
+    """
+    import pulp
+
+    # Модели в кэше процесса занимают память сверх текущего решения и вычитаются из его ограничения.
+    with limited(reserved=_cached_model_bytes()):
+        try:
+            return function(*args)
+        except pulp.PulpSolverError as e:
+            # CBC наследует rlimit процесса и при их превышении завершается аварийно.
+            raise SolveLimitExceeded(f'Решатель CBC завершился с ошибкой, возможно, из-за ограничения '
+                                     f'памяти или времени: {e}')
+
+
+def check_size(meta_data: MetaData, restriction: Restriction):
+    """
+    Заранее отклоняет задачу, модель которой по прогнозу не помещается в память.
+    :raises SolveLimitExceeded: прогноз превышает SOLVE_MEMORY_LIMIT.
+    """
+    check_model_size(*_model_size(meta_data, restriction), meta_data.solver == SolverEnum.FAST)
+
+
+def _model_size(meta_data: MetaData, restriction: Restriction) -> tuple:
+    return meta_data.rows, len(meta_data.get_load_data_free_chlen_len()) - 1, len(restriction.entries)
+
+
+def _solve_exact(meta_data: MetaData, restriction: Restriction, data: 'Data') -> 'Result':
+    """
+    Решает задачу точно. Если к набору данных только что дописаны строки и модель
+    родительского набора есть в кэше процесса, то она дополняется новыми строками
+    и решается от предыдущего решения; иначе модель строится заново.
+    Кэш ограничен SOLVE_MODEL_CACHE_SIZE моделями и половиной SOLVE_MEMORY_LIMIT
+    по прогнозу памяти, чтобы решению оставалась хотя бы половина ограничения.
+    """
+    from server.lp import LpSolve
+
+    solver = None
+    if meta_data.parent_dataset_id and meta_data.appended_rows:
+        with _models_lock:
+            solver, _ = _models.pop(_model_key(meta_data, restriction, meta_data.parent_dataset_id), (None, 0))
+
+    if solver is not None:
+        solver.append(data)
+        if solver.result.stats['status'] != 'Optimal':
+            solver = None
+    if solver is None:
+        solver = LpSolve(data)
+
+    if SOLVE_MODEL_CACHE_SIZE > 0 and meta_data.dataset_id:
+        with _models_lock:
+            _models[_model_key(meta_data, restriction, meta_data.dataset_id)] = \
+                (solver, predict_model_bytes(*_model_size(meta_data, restriction)))
+            while len(_models) > SOLVE_MODEL_CACHE_SIZE or \
+                    (SOLVE_MEMORY_LIMIT and _cached_model_bytes() > SOLVE_MEMORY_LIMIT // 2):
+                _models.popitem(last=False)
+    return solver.result
+
+
+def _cached_model_bytes() -> int:
+    return sum(size for _, size in _models.values())
+
+
+def _model_key(meta_data: MetaData, restriction: Restriction, dataset_id: str) -> tuple:
+    return (dataset_id, meta_data.var_y, meta_data.free_chlen, meta_data.delta, meta_data.tau, meta_data.weights_col,
+            json.dumps(restriction, cls=Restriction.DataEncoder))
+
+
+def submit(meta_data: MetaData, restriction: Restriction) -> 'Result':
+    """
+    Передаёт задачу в пул процессов и ожидает результат.
+    Если уже заняты все воркеры и очередь, то задача отклоняется.
+    При SOLVE_WORKERS = 0 решение выполняется в текущем потоке,
+    при SOLVE_BACKEND = queue - воркерами очереди в Redis.
+    :raises SolverBusy: очередь решений заполнена.
+    :raises SolveFailed: воркеры очереди не смогли решить задачу.
+    :raises SolveLimitExceeded: модель не помещается в ограничения памяти или времени.
+    """
+
+    check_size(meta_data, restriction)
+
+    if SOLVE_BACKEND == 'queue':
+        from server import job_queue
+
+        result = job_queue.submit(meta_data, restriction)
+        metrics.observe_solve(result.stats)
+        return result
+
+    if not _slots.acquire(blocking=False):
+        metrics.SOLVE_REJECTED.inc()
+        raise SolverBusy()
+
+    try:
+        if SOLVE_WORKERS == 0:
+            result = solve(meta_data, restriction, time.time())
+        else:
+            result = _run_in_pool(run_limited, solve, meta_data, restriction, time.time())
+    finally:
+        _slots.release()
+
+    metrics.observe_solve(result.stats)
+    return result
+
+
+def solve_quantiles(meta_data: MetaData, restriction: Restriction, taus: list, submit_time: float = None) -> list:
+    """
+    Решает задачу точно для нескольких квантилей. Модель строится один раз, для каждого
+    следующего τ заменяется только функция цели, и решение начинается с предыдущего.
+    Выполняется в процессе пула решателя.
+    :param taus: квантили; соседние значения дают близкие решения.
+    :return: результаты в порядке taus.
+    """
+    from server.lp import Data, LpSolve
+
+    queue_wait = time.time() - submit_time if submit_time is not None else 0
+
+    start = time.perf_counter()
+    data = Data(meta_data, restriction)
+    data_time = time.perf_counter() - start
+
+    results = []
+    solver = None
+    for tau in taus:
+        with accounted({}) as stats:
+            if solver is None:
+                data.tau = tau
+                solver = LpSolve(data)
+            else:
+                solver.set_tau(tau)
+        solver.result.stats.update(stats)
+        solver.result.stats['timings']['data'] = data_time
+        solver.result.stats['timings']['queue_wait'] = queue_wait
+        results.append(solver.result)
+        data_time = queue_wait = 0
+    return results
+
+
+def submit_quantiles(meta_data: MetaData, restriction: Restriction, taus: list) -> list:
+    """
+    Решает задачу для нескольких квантилей одной задачей пула (см. solve_quantiles).
+    При SOLVE_BACKEND = queue каждый квантиль - отдельная задача очереди без тёплого старта.
+    :raises SolverBusy: очередь решений заполнена.
+    :raises SolveFailed: воркеры очереди не смогли решить задачу.
+    """
+
+    check_size(_tau_meta_data(meta_data, 0.5), restriction)
+
+    if SOLVE_BACKEND == 'queue':
+        from server import job_queue
+
+        jobs = [job_queue.enqueue(_tau_meta_data(meta_data, tau), restriction) for tau in taus]
+        results = [job_queue.wait(job_id) for job_id in jobs]
+    else:
+        if not _slots.acquire(blocking=False):
+            metrics.SOLVE_REJECTED.inc()
+            raise SolverBusy()
+        try:
+            if SOLVE_WORKERS == 0:
+                results = solve_quantiles(meta_data, restriction, taus, time.time())
+            else:
+                results = _run_in_pool(run_limited, solve_quantiles, meta_data, restriction, taus, time.time())
+        finally:
+            _slots.release()
+
+    for result in results:
+        metrics.observe_solve(result.stats)
+    return results
+
+
+def _tau_meta_data(meta_data: MetaData, tau: float) -> MetaData:
+    tau_meta_data = MetaData(json.loads(json.dumps(meta_data, cls=MetaData.DataEncoder)))
+    tau_meta_data.tau = tau
+    tau_meta_data.solver = SolverEnum.EXACT
+    return tau_meta_data
+
+
+def submit_all(meta_data: MetaData, responses: list) -> 'MultiResult':
+    """
+    Строит модели, в которых откликом по очереди выступает каждый столбец из responses,
+    а регрессорами - остальные столбцы. Ограничения не применяются: они задаются
+    для регрессоров одной выбранной зависимой переменной.
+    Матрица один раз копируется в общую память, модели решаются параллельно в пуле
+    процессов; при SOLVE_BACKEND = queue каждая модель - отдельная задача очереди.
+    :param meta_data: метаданные с матрицей и параметрами free_chlen, delta, solver.
+    :param responses: номера столбцов-откликов, начинаются с 1.
+    :raises SolverBusy: в очереди решений нет места для всех моделей.
+    """
+    from server.lp import MultiResult
+
+    multi_result = MultiResult(meta_data.cols, meta_data.free_chlen, meta_data.weights_col)
+    responses = [response for response in responses if response != meta_data.weights_col]
+    check_size(meta_data, Restriction())
+
+    if SOLVE_BACKEND == 'queue':
+        from server import job_queue
+
+        jobs = [job_queue.enqueue(_response_meta_data(meta_data, response), Restriction()) for response in responses]
+        summaries = [job_queue.wait(job_id).summary() for job_id in jobs]
+    else:
+        # Каждая модель - отдельная задача пула и занимает своё место в очереди;
+        # без пула модели решаются по очереди в текущем потоке.
+        slots = len(responses) if SOLVE_WORKERS > 0 else 1
+        _acquire_slots(slots)
+        try:
+            summaries = _solve_all_local(meta_data, responses)
+        finally:
+            for _ in range(slots):
+                _slots.release()
+
+    for response, summary in zip(responses, summaries):
+        metrics.observe_solve(summary['stats'])
+        multi_result.add(response, summary)
+    return multi_result
+
+
+def _acquire_slots(count: int):
+    """
+    Занимает count мест в очереди решений сразу или не занимает ни одного.
+    :raises SolverBusy: свободных мест меньше count.
+    """
+    acquired = 0
+    while acquired < count and _slots.acquire(blocking=False):
+        acquired += 1
+    if acquired < count:
+        for _ in range(acquired):
+            _slots.release()
+        metrics.SOLVE_REJECTED.inc()
+        raise SolverBusy()
+
+
+def _solve_all_local(meta_data: MetaData, responses: list) -> list:
+    import numpy as np
+    from multiprocessing import shared_memory
+
+    matrix = meta_data.load_data
+    if SOLVE_WORKERS == 0:
+        return [_solve_response(matrix, meta_data, response, time.time()) for response in responses]
+
+    # Матрица копируется в общую память в типе хранения: float32 занимает вдвое меньше.
+    shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+    try:
+        np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=shm.buf)[:] = matrix
+        executor = _get_executor()
+        futures = [executor.submit(run_limited, solve_response, shm.name, matrix.shape, matrix.dtype.str,
+                                   _response_meta_data(meta_data, response), response, time.time())
+                   for response in responses]
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            raise SolveFailed('Процесс решателя завершился аварийно.')
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def solve_response(shm_name: str, shape: tuple, dtype: str, meta_data: MetaData, response: int,
+                   submit_time: float) -> dict:
+    """
+    Решает модель с откликом response по матрице из общей памяти. Выполняется в процессе пула.
+    """
+    import numpy as np
+    from multiprocessing import shared_memory
+
+    # Процессы пула (spawn) используют трекер ресурсов веб-процесса: память удаляет только он.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        matrix = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        summary = _solve_response(matrix, meta_data, response, submit_time)
+        del matrix
+        return summary
+    finally:
+        shm.close()
+
+
+def _solve_response(matrix, meta_data: MetaData, response: int, submit_time: float) -> dict:
+    meta_data = _response_meta_data(meta_data, response)
+    weights_col = meta_data.weights_col
+    # Без dataset_id модель не попадает в кэш процесса и не держит ссылку на общую память.
+    meta_data.set_load_data(matrix)
+    meta_data.weights_col = weights_col
+    return solve(meta_data, Restriction(), submit_time).summary()
+
+
+def _response_meta_data(meta_data: MetaData, response: int) -> MetaData:
+    response_meta_data = MetaData(json.loads(json.dumps(meta_data, cls=MetaData.DataEncoder)))
+    response_meta_data.var_y = response
+    return response_meta_data
+
+
+def warm_up():
+    """
+    Заранее запускает процессы пула и импортирует в них numpy и pulp,
+    чтобы первое решение не ждало старта воркеров.
+    """
+
+    from server import lp  # noqa: F401
+
+    if SOLVE_WORKERS > 0 and SOLVE_BACKEND != 'queue':
+        executor = _get_executor()
+        for future in [executor.submit(_import_solver) for _ in range(SOLVE_WORKERS)]:
+            future.result()
+
+
+def _import_solver():
+    from server import lp  # noqa: F401
+
+
+def _run_in_pool(function, *args):
+    """
+    Выполняет функцию в пуле процессов. Если процесс пула завершился аварийно
+    (например, убит из-за нехватки памяти), пул пересоздаётся для следующих задач.
+    :raises SolveFailed: процесс пула завершился аварийно.
+    """
+    executor = _get_executor()
+    try:
+        return executor.submit(function, *args).result()
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise SolveFailed('Процесс решателя завершился аварийно.')
+
+
+def _discard_executor(executor: ProcessPoolExecutor):
+    global _executor
+
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            # spawn, а не fork: веб-процесс многопоточный, и fork из потока waitress небезопасен.
+            _executor = ProcessPoolExecutor(
+                max_workers=SOLVE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
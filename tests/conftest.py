@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+os.environ.setdefault('SOLVE_WORKERS', '0')
+os.environ.setdefault('BASE_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources'))
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    """
+    Отдельный fakeredis на каждый тест; кэши процесса, связанные с Redis, сбрасываются.
+    """
+    from server import redis_client
+    from server.session import _token_cache
+
+    server = fakeredis.FakeServer()
+    redis_client.set_pools({
+        True: fakeredis.FakeRedis(server=server, decode_responses=True).connection_pool,
+        False: fakeredis.FakeRedis(server=server, decode_responses=False).connection_pool,
+    })
+    monkeypatch.setattr('server.dataset._store', None)
+    _token_cache.clear()
+    return server
+
+
+@pytest.fixture
+def client(redis_server):
+    import app
+
+    return app.app.test_client()
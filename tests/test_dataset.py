@@ -0,0 +1,47 @@
+import threading
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(params=['redis', 'disk'])
+def store(request, redis_server, tmp_path):
+    from server.dataset import DiskDatasetStore, RedisDatasetStore
+
+    if request.param == 'disk':
+        return DiskDatasetStore(str(tmp_path))
+    return RedisDatasetStore()
+
+
+def test_put_during_append_keeps_dataset(store, monkeypatch):
+    from server.redis_client import get_redis
+
+    matrix = np.arange(12, dtype=np.float32).reshape(4, 3)
+    rows = np.ones((2, 3), dtype=np.float32)
+    for token in ('a', 'b'):
+        get_redis().set(token, '')
+    dataset_id = store.put(matrix, 'a')
+
+    # Дописывание на месте останавливается, пока другая сессия загружает тот же набор.
+    extending, resume = threading.Event(), threading.Event()
+    extend = store._extend
+
+    def slow_extend(*args):
+        extending.set()
+        resume.wait(5)
+        return extend(*args)
+
+    monkeypatch.setattr(store, '_extend', slow_extend)
+    appended = []
+    thread = threading.Thread(target=lambda: appended.append(store.append(dataset_id, rows, 'a')))
+    thread.start()
+    assert extending.wait(5)
+
+    put = threading.Thread(target=store.put, args=(matrix, 'b'))
+    put.start()
+    resume.set()
+    thread.join(5)
+    put.join(5)
+
+    assert np.array_equal(store.get(dataset_id), matrix)
+    assert np.array_equal(store.get(appended[0]), np.concatenate([matrix, rows]))
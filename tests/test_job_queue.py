@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def job_id(redis_server):
+    from server import job_queue
+    from server.meta_data import MetaData, Restriction
+
+    return job_queue.enqueue(MetaData(), Restriction())
+
+
+def take(job_id: str, attempts: int, deadline: float):
+    """
+    Переносит задачу в список обрабатываемых так, как это делает воркер.
+    """
+    from server import job_queue
+    from server.redis_client import get_redis
+
+    r = get_redis()
+    assert r.rpoplpush(job_queue.QUEUE_KEY, job_queue.PROCESSING_KEY) == job_id
+    r.hset(job_queue._job_key(job_id), mapping={'status': 'running', 'attempts': attempts, 'deadline': deadline})
+
+
+def test_expired_job_is_requeued(job_id):
+    from server import job_queue
+    from server.redis_client import get_redis
+
+    take(job_id, 1, time.time() - 1)
+    job_queue.Worker().requeue_expired()
+
+    r = get_redis()
+    assert r.lrange(job_queue.QUEUE_KEY, 0, -1) == [job_id]
+    assert not r.llen(job_queue.PROCESSING_KEY)
+    status, deadline, error = r.hmget(job_queue._job_key(job_id), ['status', 'deadline', 'error'])
+    assert (status, deadline, error) == ('queued', None, 'visibility timeout expired')
+
+
+def test_running_job_is_kept(job_id):
+    from server import job_queue
+    from server.redis_client import get_redis
+
+    take(job_id, 1, time.time() + 60)
+    job_queue.Worker().requeue_expired()
+
+    assert get_redis().lrange(job_queue.PROCESSING_KEY, 0, -1) == [job_id]
+
+
+def test_job_fails_after_max_attempts(job_id):
+    from server import job_queue
+    from server.config import QUEUE_MAX_ATTEMPTS
+    from server.redis_client import get_redis
+
+    take(job_id, QUEUE_MAX_ATTEMPTS, time.time() - 1)
+    job_queue.Worker().requeue_expired()
+
+    r = get_redis()
+    assert not r.llen(job_queue.QUEUE_KEY)
+    assert not r.llen(job_queue.PROCESSING_KEY)
+    assert r.hget(job_queue._job_key(job_id), 'status') == 'failed'
+    with pytest.raises(job_queue.SolveFailed):
+        job_queue.wait(job_id, timeout=1)
+
+
+def test_wait_timeout_cancels_job(job_id, monkeypatch):
+    from server import job_queue
+    from server.redis_client import get_redis
+
+    with pytest.raises(job_queue.SolverBusy):
+        job_queue.wait(job_id, timeout=1)
+
+    r = get_redis()
+    assert not r.llen(job_queue.QUEUE_KEY)
+
+    # Воркер, забравший задачу до отмены, не решает её.
+    monkeypatch.setattr(job_queue, 'run_limited', lambda *args: pytest.fail('cancelled job was solved'))
+    r.lpush(job_queue.PROCESSING_KEY, job_id)
+    job_queue.Worker().process(job_id)
+
+    assert not r.exists(job_queue._job_key(job_id))
+    assert not r.llen(job_queue.PROCESSING_KEY)
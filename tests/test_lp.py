@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+
+def make_data(n: int, p: int):
+    from server.lp import Data
+    from server.meta_data import Restriction, SolverEnum
+
+    rng = np.random.default_rng(0)
+    data = Data.__new__(Data)
+    data.restriction = Restriction(p)
+    data.delta = 0
+    data.tau = 0.5
+    data.solver = SolverEnum.FAST
+    data._omega = None
+    data.dtype = np.dtype(np.float64)
+    data.x = np.column_stack([np.ones(n), rng.normal(size=(n, p - 1))])
+    data.y = data.x @ rng.normal(size=p) + rng.laplace(size=n)
+    data.weights = np.ones(n)
+    return data
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 3, 17, 64, 100, 257])
+def test_count_increasing_pairs_with_ties(n):
+    from server.lp import _count_increasing_pairs
+
+    ranks = np.random.default_rng(n).integers(0, max(n // 4, 1), n)
+    expected = sum(1 for i in range(n) for j in range(i + 1, n) if ranks[i] < ranks[j])
+    assert _count_increasing_pairs(ranks) == expected
+
+
+def test_fast_fallback_checks_exact_size(monkeypatch):
+    from server.limits import SolveLimitExceeded, predict_model_bytes
+    from server.lp import FastLpSolve
+
+    data = make_data(400, 3)
+    # Уточнение не решено, а полная модель не помещается в ограничение.
+    monkeypatch.setattr(FastLpSolve, '_refine', lambda self, a: (None, None))
+    monkeypatch.setattr('server.limits.SOLVE_MEMORY_LIMIT', predict_model_bytes(400, 3) - 1)
+
+    with pytest.raises(SolveLimitExceeded):
+        FastLpSolve(data)
+
+
+def restriction_constraints(restriction) -> dict:
+    """
+    Строит модель ЛП с ограничениями и возвращает ограничения на коэффициенты по именам.
+    """
+    from server.lp import LpSolve
+
+    data = make_data(5, restriction.x)
+    data.restriction = restriction
+    solver = LpSolve(data, execute=False)
+    return {name: str(constraint) for name, constraint in solver._problem.constraints.items()
+            if int(name) >= data.y.size}
+
+
+def test_legacy_dense_restriction_matches_entries():
+    import json
+    from server.meta_data import OperatorEnum, Restriction
+
+    # Ограничения в формате сессий до разреженного хранения: плотная матрица data.
+    legacy = json.loads('{"x": 4, "y": 3, "data": [[1.0, 0.0, -2.0, 0.0], [0.0, 0.0, 0.0, 3.0], [0.0, 0.0, 0.0, 0.0]], '
+                        '"operators": ["EQUALS", "MORE_OR_EQUAL", "LESS_OR_EQUAL"], "b": [0.0, 1.5, 2.0]}')
+    restriction = Restriction(data=json.loads(json.dumps(Restriction(data=legacy), cls=Restriction.DataEncoder)))
+
+    expected = Restriction(4)
+    expected.set_entries([(0, 0, 1.0), (0, 2, -2.0), (1, 3, 3.0)],
+                         [OperatorEnum.EQUALS, OperatorEnum.MORE_OR_EQUAL, OperatorEnum.LESS_OR_EQUAL], [0.0, 1.5, 2.0])
+
+    assert restriction.entries == expected.entries
+    assert restriction_constraints(restriction) == restriction_constraints(expected)
+    assert len(restriction_constraints(expected)) == 2
+
+    restriction.resize(3)
+    expected.resize(3)
+    assert restriction.entries == expected.entries == [[0, 0, 1.0], [0, 2, -2.0]]
+    assert restriction_constraints(restriction) == restriction_constraints(expected)
@@ -0,0 +1,52 @@
+import datetime
+
+from server.redis_client import get_redis
+from server.session import Session, Token
+
+
+def test_legacy_session_is_replaced(client):
+    token = Token()
+    r = get_redis()
+    # Формат сессии до хранения в хэше: строка по токену и отдельные ключи полей.
+    r.set(token.body, '')
+    r.expireat(token.body, Session.expire_at_for(token.create_time))
+    for suffix in ('_metaData', '_result', '_restriction'):
+        r.set(f'{token.body}{suffix}', '{}')
+
+    with client.session_transaction() as session:
+        session['token'] = token.body
+
+    for path in ('/', '/data', '/history'):
+        assert client.get(path).status_code in (200, 302)
+
+    with client.session_transaction() as session:
+        new_token = session['token']
+    assert new_token != token.body
+    assert r.type(new_token) == 'hash'
+    assert not r.exists(token.body, *[f'{token.body}{suffix}' for suffix in ('_metaData', '_result', '_restriction')])
+
+
+def test_session_expires_at_four(client):
+    client.get('/')
+    with client.session_transaction() as session:
+        token = Token(session['token'])
+
+    expire_at = Session.expire_at_for(token.create_time)
+    assert 0 < get_redis().ttl(token.body) <= (expire_at - datetime.datetime.now()).total_seconds() + 1
+
+
+def test_history_write_restores_expiry(redis_server):
+    from server.lp import Result
+    from server.meta_data import MetaData, Restriction
+
+    token = Token()
+    session = Session(token)
+    # Хэш сессии истёк между чтением и записью истории.
+    get_redis().delete(token.body)
+
+    result = Result.new_result({'dtype': 'float64', 'a': [1.0], 'eps': [0.5], 'yy': [1.5], 'e': 0.5, 'osp': 0.1,
+                                'count_rows': 1, 'stats': {}})
+    assert session.history.add('settings', MetaData({}), Restriction(), result) is not None
+
+    expire_at = Session.expire_at_for(token.create_time)
+    assert 0 < get_redis().ttl(token.body) <= (expire_at - datetime.datetime.now()).total_seconds() + 1
@@ -0,0 +1,62 @@
+import io
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def float32_precision(monkeypatch):
+    monkeypatch.setattr('server.precision.MATRIX_PRECISION', 'float32')
+
+
+def npy(matrix: np.ndarray) -> bytes:
+    stream = io.BytesIO()
+    np.save(stream, matrix, allow_pickle=False)
+    return stream.getvalue()
+
+
+def stored(dataset_id: str) -> np.ndarray:
+    from server.dataset import get_store
+
+    return get_store().get(dataset_id)
+
+
+def test_int_npy_is_stored_as_float(client):
+    response = client.post('/api/load', data=npy(np.arange(12, dtype=np.int64).reshape(4, 3)))
+
+    assert response.status_code == 200
+    matrix = stored(response.get_json()['dataset_id'])
+    assert matrix.dtype == np.float32
+    assert matrix.tolist() == np.arange(12).reshape(4, 3).tolist()
+
+
+def test_string_npy_is_rejected(client):
+    from server.dataset import DatasetStore
+    from server.redis_client import get_redis
+
+    response = client.post('/api/load', data=npy(np.array([['a', 'b'], ['c', 'd']], dtype='<U1')))
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Файл содержит нечисловые значения.'
+    assert not get_redis().hgetall(DatasetStore.SIZE_KEY)
+
+
+def test_float64_npy_follows_precision(client):
+    matrix = np.random.default_rng(0).uniform(1, 10, size=(5, 3))
+    response = client.post('/api/load', data=npy(matrix))
+
+    assert response.status_code == 200
+    result = stored(response.get_json()['dataset_id'])
+    assert result.dtype == np.float32
+    assert np.array_equal(result, matrix.astype(np.float32))
+
+
+def test_ragged_text_is_rejected(client):
+    from server.dataset import DatasetStore
+    from server.redis_client import get_redis
+
+    response = client.post('/api/load', data=b'1 2 3\n4 5\n6 7 8 9\n')
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Файл содержит нечисловые значения или строки с разным количеством чисел.'
+    assert not get_redis().hgetall(DatasetStore.SIZE_KEY)
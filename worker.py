@@ -0,0 +1,30 @@
+"""
+Воркер решателя: получает задачи из очереди в Redis, решает их и записывает
+результаты. Веб-сервер ставит задачи в очередь при SOLVE_BACKEND=queue.
+Воркеров можно запускать сколько угодно на любых узлах с доступом к Redis
+(и к DATA_DIR при DATASET_BACKEND=disk).
+
+Каждый воркер решает одну задачу за раз, для параллельности запускается
+несколько воркеров (docker compose up --scale worker=4).
+
+Пример запуска:
+    python worker.py
+"""
+
+import logging
+import signal
+
+from server.job_queue import Worker
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    worker = Worker()
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()